@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2025 tombraid@snu.ac.kr
+# All right reserved.
+#
+# KSB7958 장비 제어 라이브러리
+# 임포트할 때는 설정 파일을 읽거나 연결을 맺지 않습니다.
+#
+#   from KSB7958 import SwitchTester, load_config
+#   config = load_config('KSB7958/conf.json')
+#   with SwitchTester(config['modbus_ip'], config['modbus_port']) as tester:
+#       tester.run_single_test(0, 'FCU팬')
+#
+from .ksconstants import CMDCODE, STATCODE, PRIVCODE
+from .connection import ModbusDevice, load_config
+from .read_sensor import devices, readsensor, readsensor_raw, readall
+from .control_priv import readcontrol, changecontrol
+from .position import PositionEstimator
+from .privilege import PrivilegeMonitor
+from .switch import SwitchTester
+from .retractable import RetractableTester
+from .nutsupply import NutSupplyTester
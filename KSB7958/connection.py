@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2025 tombraid@snu.ac.kr
+# All right reserved.
+#
+import os
+import json
+from pymodbus.client import ModbusTcpClient
+try:
+    from .frames import RawReader
+    from .tracing import now_us
+except ImportError:
+    from frames import RawReader
+    from tracing import now_us
+
+# 연결 관리
+# 모듈을 임포트할 때는 어떤 입출력도 하지 않습니다.
+# 연결은 처음 사용할 때 맺고, 같은 클라이언트를 다시 사용하며, close() 나 with 문으로 닫습니다.
+
+def load_config(path='conf.json'):
+    # 현재 디렉토리에 설정 파일이 없으면 패키지 디렉토리의 conf.json 을 사용합니다.
+    if not os.path.exists(path) and not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+    with open(path, 'r') as f:
+        return json.load(f)
+
+class ModbusDevice:
+    def __init__(self, ip, port, client=None):
+        self.ip = ip
+        self.port = port
+        self._client = client
+        self._reader = None
+        self.owner = client is None     # 직접 만든 연결만 닫습니다.
+        self.tracer = None              # tracing.Tracer
+        self.queued = None              # send_command 에 들어온 시각 (추적용)
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = ModbusTcpClient(self.ip, port=self.port)
+        if not self._client.connected:
+            self._client.connect()
+        return self._client
+
+    @property
+    def reader(self):
+        # 레지스터 값을 버퍼로 바로 읽는 빠른 경로 (frames.py)
+        if self._reader is None:
+            self._reader = RawReader(self.client)
+        return self._reader
+
+    def write_registers(self, address, values, unit):
+        # 명령 블록을 씁니다. values 는 [명령, OPID, ...] 형식입니다.
+        # 대기열에서 다시 전송하는 명령처럼 send_command 밖에서 불리면 지금부터 잽니다.
+        queued = self.queued if self.queued is not None else now_us()
+        self.queued = None
+        client = self.client
+        sent = now_us()
+        client.write_registers(address, values, device_id=unit)
+        if self.tracer is not None:
+            self.tracer.command_sent(unit, address, values[1], values[0], queued, sent, now_us())
+
+    def trace_status(self, unit, address, opid, stat, start):
+        # 상태 블록에서 읽은 OPID 와 상태를 명령 구간에 연결합니다. address 는 명령 블록 주소입니다.
+        if self.tracer is not None:
+            self.tracer.status_read(unit, address, opid, stat, start, now_us())
+
+    def close(self):
+        if self.owner and self._client is not None:
+            self._client.close()
+            self._client = None
+            self._reader = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -7,18 +7,12 @@
 #
 
 import time
-import json
-from pymodbus.client import ModbusTcpClient
-from ksconstants import STATCODE, CMDCODE, PRIVCODE
-
-# Load configuration
-with open('conf.json', 'r') as f:
-    config = json.load(f)
-
-# 슬레이브 5는 양액기 노드
-slave = 5
-client = ModbusTcpClient(config['modbus_ip'], port=config['modbus_port'])
-client.connect()
+try:
+    from .ksconstants import STATCODE, CMDCODE, PRIVCODE
+    from .connection import ModbusDevice, load_config
+except ImportError:
+    from ksconstants import STATCODE, CMDCODE, PRIVCODE
+    from connection import ModbusDevice, load_config
 
 def readcontrol(client, slave):
     # 슬레이브로부터 201번지에서 3개의 레지스터를 읽습니다.
@@ -46,9 +40,18 @@ def changecontrol(client, opid, control, slave):
     # 슬레이브에 제어권 변경 명령을 보냅니다.
     client.write_registers(501, [CMDCODE.CHANGE_CONTROL, opid, control], device_id=slave)
 
-reg = readcontrol(client, slave)
-if not reg.isError():
-    print ("제어권을 토글합니다.")
-    changecontrol(client, reg.registers[1] + 1, PRIVCODE.LOCAL if reg.registers[2] == PRIVCODE.REMOTE else PRIVCODE.REMOTE, slave)
-    time.sleep(5)
+def togglecontrol(client, slave):
     reg = readcontrol(client, slave)
+    if not reg.isError():
+        print ("제어권을 토글합니다.")
+        changecontrol(client, reg.registers[1] + 1, PRIVCODE.LOCAL if reg.registers[2] == PRIVCODE.REMOTE else PRIVCODE.REMOTE, slave)
+        time.sleep(5)
+        reg = readcontrol(client, slave)
+    return reg
+
+if __name__ == "__main__":
+    config = load_config()
+    # 슬레이브 5는 양액기 노드
+    slave = 5
+    with ModbusDevice(config['modbus_ip'], config['modbus_port']) as conn:
+        togglecontrol(conn.client, slave)
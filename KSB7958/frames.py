@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2025 tombraid@snu.ac.kr
+# All right reserved.
+#
+import sys
+import struct
+import itertools
+from array import array
+
+# 레지스터 블록 레이아웃
+# 장비는 32비트 값을 struct.pack('HH', reg1, reg2) 순서(하위 워드 먼저)로 담습니다.
+# RawReader 가 돌려주는 버퍼는 레지스터를 네이티브 바이트 순서로 바꿔 둔 것이므로
+# 아래 레이아웃으로 바로 읽을 수 있습니다. 오프셋은 바이트 단위(레지스터 번호 * 2)입니다.
+WORDS2 = struct.Struct('=HH')
+FLOAT = struct.Struct('=f')
+INT = struct.Struct('=i')
+
+SENSOR = struct.Struct('=fH')           # 관측치, 상태
+CONTROL = struct.Struct('=HHH')         # 노드상태, OPID, 제어권
+SWITCH = struct.Struct('=HHi')          # OPID, 상태, 남은시간
+RETRACTABLE = struct.Struct('=HHiH')    # OPID, 상태, 남은시간, 개도율
+NUTSUPPLY = struct.Struct('=HHHHi')     # 상태, 관수구역, 에러코드, OPID, 남은시간
+
+# Modbus TCP 프레임 (빅엔디안)
+REQUEST = struct.Struct('>HHHBBHH')     # 트랜잭션, 프로토콜, 길이, 유닛, 기능코드, 주소, 개수
+MBAP = struct.Struct('>HHHB')           # 트랜잭션, 프로토콜, 길이(유닛 포함), 유닛
+READ_HOLDING = 3
+
+# pymodbus 는 같은 소켓에서 트랜잭션 ID 를 1 부터 65000 까지 돌려 씁니다.
+# 빠른 경로는 그 위의 구간만 사용하므로, pymodbus 요청의 늦은 응답이 빠른 경로의 응답으로 잘못 해석되지 않습니다.
+TID_FIRST = 65001
+TID_LAST = 0xFFFF
+
+def words2float(reg1, reg2):
+    return FLOAT.unpack(WORDS2.pack(reg1, reg2))[0]
+
+def words2int(reg1, reg2):
+    return INT.unpack(WORDS2.pack(reg1, reg2))[0]
+
+class RawReader:
+    # pymodbus 클라이언트의 소켓으로 읽기 요청을 직접 보내고,
+    # 응답의 레지스터 영역을 레지스터마다 파이썬 객체를 만들지 않고 버퍼로 돌려줍니다.
+    def __init__(self, client, timeout=3):
+        self.client = client
+        self.timeout = timeout
+        self.tid = itertools.cycle(range(TID_FIRST, TID_LAST + 1))
+        self.header = bytearray(MBAP.size)
+
+    def _recv_into(self, sock, buf):
+        view = memoryview(buf)
+        while view:
+            n = sock.recv_into(view)
+            if n == 0:
+                raise ConnectionError("게이트웨이가 연결을 끊었습니다.")
+            view = view[n:]
+
+    def read(self, address, count, unit):
+        # 성공하면 네이티브 바이트 순서의 레지스터 버퍼(memoryview)를, 실패하면 None 을 반환합니다.
+        if not self.client.connected and not self.client.connect():
+            print("게이트웨이에 연결할 수 없습니다.")
+            return None
+
+        sock = self.client.socket
+        tid = next(self.tid)
+        try:
+            sock.settimeout(self.timeout)
+            sock.sendall(REQUEST.pack(tid, 0, 6, unit, READ_HOLDING, address, count))
+            while True:
+                # 프레임은 기능코드와 상관없이 MBAP 의 길이 필드로 나눕니다.
+                # 그래야 pymodbus 쓰기(FC16)의 늦은 응답처럼 다른 모양의 프레임도 통째로 버릴 수 있습니다.
+                self._recv_into(sock, self.header)
+                rtid, _, length, runit = MBAP.unpack(self.header)
+                if not 3 <= length <= 254:
+                    raise ConnectionError(f"잘못된 Modbus 프레임 길이입니다. {length}")
+                pdu = bytearray(length - 1)
+                self._recv_into(sock, pdu)
+                if rtid == tid and runit == unit:
+                    break
+                # 앞선 요청이나 pymodbus 요청의 늦은 응답은 버립니다.
+        except (OSError, ConnectionError) as e:
+            print(f"레지스터 읽기 실패 : {e}")
+            self.client.close()
+            return None
+
+        func = pdu[0]
+        if func & 0x80:
+            print(f"Modbus 예외 응답입니다. 예외코드는 {pdu[1]} 입니다.")
+            return None
+        if len(pdu) != count * 2 + 2 or func != READ_HOLDING or pdu[1] != count * 2:
+            print(f"응답이 맞지 않습니다. 기능코드 {func}, 길이 {len(pdu) - 2} != {count * 2}")
+            return None
+        data = memoryview(pdu)[2:]
+
+        words = array('H')
+        words.frombytes(data)
+        if sys.byteorder == 'little':
+            words.byteswap()
+        return memoryview(words).cast('B')
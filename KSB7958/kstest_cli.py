@@ -6,13 +6,34 @@
 # All right reserved.
 #
 import argparse
-import json
 import sys
-from switch import SwitchTester
-from retractable import RetractableTester
-from nutsupply import NutSupplyTester
+try:
+    from .switch import SwitchTester
+    from .retractable import RetractableTester
+    from .nutsupply import NutSupplyTester
+    from .privilege import PrivilegeMonitor
+    from .connection import ModbusDevice, load_config
+    from .tracing import Tracer
+except ImportError:
+    from switch import SwitchTester
+    from retractable import RetractableTester
+    from nutsupply import NutSupplyTester
+    from privilege import PrivilegeMonitor
+    from connection import ModbusDevice, load_config
+    from tracing import Tracer
+
+def make_tester(cls, conn, monitor, tracer=None):
+    # 하나의 연결을 공유하고, 원격제어 상태가 아닌 노드로는 명령을 보내지 않도록 제어권 감시기를 붙입니다.
+    return cls(conn.ip, conn.port, monitor=monitor, client=conn.client, tracer=tracer)
 
 def run_tests(tester, device_index=None):
+    if tester.tracer is not None:
+        with tester.tracer.control_cycle(tester.__class__.__name__, device=device_index):
+            run_tests_untraced(tester, device_index)
+    else:
+        run_tests_untraced(tester, device_index)
+
+def run_tests_untraced(tester, device_index=None):
     if hasattr(tester, 'devices') and device_index is not None:
         if 0 <= device_index < len(tester.devices):
             dev_name = tester.devices[device_index]
@@ -28,7 +49,13 @@ def run_tests(tester, device_index=None):
 def interactive_mode(ip, port):
     print("KSTEST Interactive Mode")
     print("-----------------------")
-    
+
+    # 대화형 모드 동안 하나의 연결을 재사용하고, 끝나면 닫습니다.
+    with ModbusDevice(ip, port) as conn:
+        monitor = PrivilegeMonitor(conn.client)
+        interactive_loop(conn, monitor)
+
+def interactive_loop(conn, monitor):
     while True:
         # 1. Select device type
         print("\nSelect device type:")
@@ -48,14 +75,14 @@ def interactive_mode(ip, port):
 
         # 2. Select specific device or all
         if selected_type == 'switch':
-            tester = SwitchTester(ip, port)
+            tester = make_tester(SwitchTester, conn, monitor)
             prompt_for_device_selection(tester)
         elif selected_type == 'retractable':
-            tester = RetractableTester(ip, port)
+            tester = make_tester(RetractableTester, conn, monitor)
             prompt_for_device_selection(tester)
         elif selected_type == 'nutsupply':
             print("\nRunning nutsupply tests...")
-            tester = NutSupplyTester(ip, port)
+            tester = make_tester(NutSupplyTester, conn, monitor)
             tester.run_tests()
 
         # 3. Ask to continue
@@ -89,8 +116,7 @@ def prompt_for_device_selection(tester):
             print("Invalid input. Please enter a number or 'all'.")
 
 def main():
-    with open('conf.json', 'r') as f:
-        config = json.load(f)
+    config = load_config()
     ip = config['modbus_ip']
     port = config['modbus_port']
 
@@ -100,20 +126,30 @@ def main():
         parser = argparse.ArgumentParser(description="KSTEST Command Line Interface")
         parser.add_argument('type', choices=['switch', 'retractable', 'nutsupply'], help='Type of device to test')
         parser.add_argument('--device', type=int, help='The index of the device to test. If not provided, all devices of the type will be tested.')
+        parser.add_argument('--trace', metavar='FILE', help='Write control latency spans to FILE in Chrome Trace Event format.')
         args = parser.parse_args()
 
-        if args.type == 'switch':
-            tester = SwitchTester(ip, port)
-            run_tests(tester, args.device)
-        elif args.type == 'retractable':
-            tester = RetractableTester(ip, port)
-            run_tests(tester, args.device)
-        elif args.type == 'nutsupply':
-            if args.device is not None:
-                print("Error: --device option is not applicable for nutsupply.")
-            else:
-                tester = NutSupplyTester(ip, port)
-                tester.run_tests()
+        tracer = Tracer(args.trace) if args.trace else None
+        try:
+            with ModbusDevice(ip, port) as conn:
+                monitor = PrivilegeMonitor(conn.client)
+                if args.type == 'switch':
+                    tester = make_tester(SwitchTester, conn, monitor, tracer)
+                    run_tests(tester, args.device)
+                elif args.type == 'retractable':
+                    tester = make_tester(RetractableTester, conn, monitor, tracer)
+                    run_tests(tester, args.device)
+                elif args.type == 'nutsupply':
+                    if args.device is not None:
+                        print("Error: --device option is not applicable for nutsupply.")
+                    else:
+                        tester = make_tester(NutSupplyTester, conn, monitor, tracer)
+                        run_tests(tester)
+        finally:
+            # Ctrl-C 나 예외로 끝나도 진행 중인 명령을 unfinished 로 닫고 JSON 배열을 마무리합니다.
+            if tracer is not None:
+                tracer.close()
+                print(f"Trace written to {args.trace}")
 
 if __name__ == "__main__":
     main()
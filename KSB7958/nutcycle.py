@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2025 tombraid@snu.ac.kr
+# All right reserved.
+#
+import time
+try:
+    from .ksconstants import STATCODE
+    from .frames import SENSOR, NUTSUPPLY
+    from .tracing import now_us
+except ImportError:
+    from ksconstants import STATCODE
+    from frames import SENSOR, NUTSUPPLY
+    from tracing import now_us
+
+# 양액 공급 주기 감시기
+# 관수 중(PREPARING/SUPPLYING/FINISHING)에는 매 주기마다 양액기 상태 블록(401)과
+# EC(204), pH(213), 누적유량(225) 센서 블록을 읽어 관수 1회의 기록을 만듭니다.
+# 세 센서 블록은 204번지부터 24개 레지스터를 한 번에 읽고, 상태 블록은 주소가 멀어
+# (한 번에 읽을 수 있는 125개를 넘습니다) 따로 읽으므로 주기마다 두 번만 읽습니다.
+
+SENSOR_START = 204
+SENSOR_COUNT = 24
+EC_OFFSET = (204 - SENSOR_START) * 2
+PH_OFFSET = (213 - SENSOR_START) * 2
+FLOW_OFFSET = (225 - SENSOR_START) * 2
+
+ACTIVE = (STATCODE.PREPARING, STATCODE.SUPPLYING, STATCODE.FINISHING)
+
+class SupplyCycle:
+    def __init__(self, opid, zone, now):
+        self.opid = opid
+        self.zone = zone
+        self.start = now
+        self.end = None
+        self.phases = {}        # 상태코드 -> 머문 시간(초)
+        self.samples = []       # (시각, 상태, EC, pH, 누적유량)
+        self.errors = []        # (시각, 에러코드)
+        self.lastsample = None
+
+    def add(self, now, stat, ec, ph, flow):
+        if self.lastsample is not None:
+            prev = self.lastsample[1]
+            self.phases[prev] = self.phases.get(prev, 0.0) + now - self.lastsample[0]
+        self.lastsample = (now, stat)
+        self.samples.append((now, stat, ec, ph, flow))
+
+    def volume(self):
+        # 누적유량의 처음과 마지막 정상값 차이를 공급량으로 봅니다.
+        flows = [s[4] for s in self.samples if s[4] is not None]
+        return flows[-1] - flows[0] if len(flows) > 1 else 0.0
+
+    def trajectory(self, index):
+        return [(s[0], s[index]) for s in self.samples if s[index] is not None]
+
+    def summary(self):
+        return {
+            "opid": self.opid,
+            "zone": self.zone,
+            "start": self.start,
+            "end": self.end,
+            "duration": (self.end or self.lastsample[0]) - self.start,
+            "phases": {stat: round(sec, 3) for stat, sec in self.phases.items()},
+            "volume": self.volume(),
+            "ec": self.trajectory(2),
+            "ph": self.trajectory(3),
+            "errors": self.errors
+        }
+
+class SupplyCycleMonitor:
+    def __init__(self, device, unit=5, interval=1, onalert=None):
+        self.device = device            # connection.ModbusDevice (reader 를 사용합니다.)
+        self.unit = unit
+        self.interval = interval
+        self.onalert = onalert          # onalert(cycle, errorcode)
+        self.cycle = None
+        self.history = []
+
+    def sample(self):
+        # (상태, 관수구역, 에러코드, OPID, EC, pH, 누적유량) 을 반환합니다. 상태를 읽지 못하면 None
+        reader = self.device.reader
+        start = now_us()
+        status = reader.read(401, 6, self.unit)
+        if status is None:
+            return None
+        stat, zone, error, opid, _ = NUTSUPPLY.unpack_from(status)
+        # 추적 중이면 명령 블록(504)의 명령 구간을 닫습니다.
+        self.device.trace_status(self.unit, 504, opid, stat, start)
+
+        ec = ph = flow = None
+        if self.cycle is None and stat not in ACTIVE and stat != STATCODE.ERROR:
+            # 관수 중이 아니면 센서는 읽지 않습니다.
+            return stat, zone, error, opid, ec, ph, flow
+
+        sensors = reader.read(SENSOR_START, SENSOR_COUNT, self.unit)
+        if sensors is not None:
+            val, sstat = SENSOR.unpack_from(sensors, EC_OFFSET)
+            ec = val if sstat == STATCODE.READY else None
+            val, sstat = SENSOR.unpack_from(sensors, PH_OFFSET)
+            ph = val if sstat == STATCODE.READY else None
+            val, sstat = SENSOR.unpack_from(sensors, FLOW_OFFSET)
+            flow = val if sstat == STATCODE.READY else None
+        return stat, zone, error, opid, ec, ph, flow
+
+    def tick(self, opid=None, now=None):
+        # 한 번 읽고 기록합니다. 관수가 끝났으면 끝난 SupplyCycle 을 반환합니다.
+        now = time.time() if now is None else now
+        res = self.sample()
+        if res is None:
+            print("양액기 상태 읽기 실패")
+            return None
+        stat, zone, error, ropid, ec, ph, flow = res
+        if opid is not None and ropid != opid:
+            return None
+
+        if self.cycle is None:
+            if stat not in ACTIVE and stat != STATCODE.ERROR:
+                return None
+            self.cycle = SupplyCycle(ropid, zone, now)
+            print(f"OPID {ropid} 번 관수를 시작합니다. 관수구역은 {zone} 입니다.")
+
+        cycle = self.cycle
+        cycle.add(now, stat, ec, ph, flow)
+
+        if stat == STATCODE.ERROR:
+            cycle.errors.append((now, error))
+            print(f"양액기 에러입니다. 에러코드는 {error} 입니다.")
+            if self.onalert is not None:
+                self.onalert(cycle, error)
+
+        if stat not in ACTIVE:
+            cycle.end = now
+            self.cycle = None
+            self.history.append(cycle)
+            print(f"OPID {cycle.opid} 번 관수가 끝났습니다. 공급량은 {cycle.volume()} 입니다.")
+            return cycle
+        return None
+
+    def run(self, opid, timeout=600):
+        # 관수가 끝날 때까지 감시합니다. 시간 안에 끝나지 않으면 진행중인 기록을 반환합니다.
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            cycle = self.tick(opid)
+            if cycle is not None:
+                return cycle
+            time.sleep(self.interval)
+        print(f"OPID {opid} 번 관수가 {timeout}초 안에 끝나지 않았습니다.")
+        return self.cycle
@@ -7,15 +7,25 @@
 #
 import time
 import struct
-import json
-from pymodbus.client import ModbusTcpClient
-from ksconstants import STATCODE, CMDCODE, PRIVCODE
-
-class NutSupplyTester:
-    def __init__(self, ip, port):
-        self.client = ModbusTcpClient(ip, port=port)
-        self.client.connect()
+try:
+    from .ksconstants import STATCODE, CMDCODE, PRIVCODE
+    from .connection import ModbusDevice, load_config
+    from .tracing import now_us
+    from .nutcycle import SupplyCycleMonitor
+    from .frames import SENSOR, NUTSUPPLY, words2float, words2int
+except ImportError:
+    from ksconstants import STATCODE, CMDCODE, PRIVCODE
+    from connection import ModbusDevice, load_config
+    from tracing import now_us
+    from nutcycle import SupplyCycleMonitor
+    from frames import SENSOR, NUTSUPPLY, words2float, words2int
+
+class NutSupplyTester(ModbusDevice):
+    def __init__(self, ip, port, monitor=None, client=None, tracer=None):
+        super().__init__(ip, port, client)
+        self.tracer = tracer
         self.opid = 1
+        self.monitor = monitor
         self.ec = 0.0
         self.ph = 0.0
 
@@ -29,6 +39,18 @@ class NutSupplyTester:
         return ctbl.get(cmd, "없는 명령")
 
     def send_command(self, cmd, sec=None, ec=None, ph=None):
+        # 제어권 감시기가 있으면 원격제어 상태일 때만 전송합니다.
+        # 대기열에 들어간 명령은 원격제어로 돌아올 때 issue_command 로 새 OPID 를 받아 전송됩니다.
+        self.queued = now_us()
+        try:
+            if self.monitor is None:
+                self.issue_command(cmd, sec, ec, ph)
+            else:
+                self.monitor.submit(5, self.issue_command, cmd, sec, ec, ph, key=504)
+        finally:
+            self.queued = None
+
+    def issue_command(self, cmd, sec=None, ec=None, ph=None):
         self.opid += 1
         reg = []
 
@@ -44,7 +66,7 @@ class NutSupplyTester:
             reg = [cmd, self.opid]
 
         print(f"{self.get_command_name(cmd)} 명령을 전송합니다. {reg}")
-        self.client.write_registers(504, reg, device_id=5)
+        self.write_registers(504, reg, 5)
 
     def get_status_name(self, stat):
         ctbl = {
@@ -56,46 +78,50 @@ class NutSupplyTester:
         return ctbl.get(stat, "없는 상태")
 
     def get_remain_time(self, reg1, reg2):
-        return struct.unpack('i', struct.pack('HH', reg1, reg2))[0]
+        return words2int(reg1, reg2)
 
     def get_observation(self, reg1, reg2):
-        return struct.unpack('f', struct.pack('HH', reg1, reg2))[0]
+        return words2float(reg1, reg2)
 
     def read_status(self, readtime=False):
-        reg = self.client.read_holding_registers(401, count=6, device_id=5)
-        if not reg.isError():
-            if reg.registers[3] == self.opid:
-                print(f"OPID {self.opid} 번 명령으로 {self.get_status_name(reg.registers[0])} 입니다.")
-                if reg.registers[0] == 1:
-                    print(f"양액기 에러입니다. 에러코드는 {reg.registers[2]} 입니다.")
-                elif reg.registers[0] != 0 and readtime:
-                    print(f"관수구역은 {reg.registers[1]}이고, 남은시간은 {self.get_remain_time(reg.registers[4], reg.registers[5])} 입니다.")
+        start = now_us()
+        buf = self.reader.read(401, 6, 5)
+        if buf is not None:
+            stat, zone, error, opid, remain = NUTSUPPLY.unpack_from(buf)
+            self.trace_status(5, 504, opid, stat, start)
+            if opid == self.opid:
+                print(f"OPID {self.opid} 번 명령으로 {self.get_status_name(stat)} 입니다.")
+                if stat == STATCODE.ERROR:
+                    print(f"양액기 에러입니다. 에러코드는 {error} 입니다.")
+                elif stat != 0 and readtime:
+                    print(f"관수구역은 {zone}이고, 남은시간은 {remain} 입니다.")
             else:
-                print(f"OPID가 매치되지 않습니다. 레지스터값은 {reg.registers[3]}, 기대하고 있는 값은 {self.opid} 입니다.")
+                print(f"OPID가 매치되지 않습니다. 레지스터값은 {opid}, 기대하고 있는 값은 {self.opid} 입니다.")
         else:
             print("상태 읽기 실패")
 
     def read_sensors(self):
         # 양액기에 연결된 센서값 읽기
-        reg = self.client.read_holding_registers(204, count=3, device_id=5)
-        if not reg.isError():
-            self.ec = self.get_observation(reg.registers[0], reg.registers[1])
-            print(f"EC : {self.ec}", reg.registers)
+        buf = self.reader.read(204, 3, 5)
+        if buf is not None:
+            self.ec, stat = SENSOR.unpack_from(buf)
+            print(f"EC : {self.ec}", stat)
         else:
             print("EC 센서값 읽기 실패")
             self.ec = 0.0
 
-        reg = self.client.read_holding_registers(213, count=3, device_id=5)
-        if not reg.isError():
-            self.ph = self.get_observation(reg.registers[0], reg.registers[1])
-            print(f"pH : {self.ph}", reg.registers)
+        buf = self.reader.read(213, 3, 5)
+        if buf is not None:
+            self.ph, stat = SENSOR.unpack_from(buf)
+            print(f"pH : {self.ph}", stat)
         else:
             print("pH 센서값 읽기 실패")
             self.ph = 0.0
 
-        reg = self.client.read_holding_registers(225, count=3, device_id=5)
-        if not reg.isError():
-            print(f"유량 : {self.get_observation(reg.registers[0], reg.registers[1])}", reg.registers)
+        buf = self.reader.read(225, 3, 5)
+        if buf is not None:
+            flow, stat = SENSOR.unpack_from(buf)
+            print(f"유량 : {flow}", stat)
         else:
             print("유량 센서값 읽기 실패")
 
@@ -108,22 +134,21 @@ class NutSupplyTester:
         self.read_status()
 
         # 양액 관수 : NUT_WATER
+        # 관수 중에는 상태와 EC/pH/유량을 함께 읽어 관수 1회의 기록을 남깁니다.
         self.send_command(CMDCODE.NUT_WATER, 30, self.ec, self.ph)
-        for _ in range(1, 40):
-            self.read_status(True)
-            time.sleep(1)
+        cycle = SupplyCycleMonitor(self).run(self.opid, timeout=40)
+        if cycle is not None:
+            print(f"관수 기록 : {cycle.summary()}")
 
         # 종료 확인
         self.send_command(CMDCODE.OFF)
         time.sleep(5)
         self.read_status()
         
-        self.client.close()
+        self.close()
 
 if __name__ == "__main__":
-    with open('conf.json', 'r') as f:
-        config = json.load(f)
-
-    tester = NutSupplyTester(config['modbus_ip'], config['modbus_port'])
-    tester.run_tests()
+    config = load_config()
+    with NutSupplyTester(config['modbus_ip'], config['modbus_port']) as tester:
+        tester.run_tests()
 
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2025 tombraid@snu.ac.kr
+# All right reserved.
+#
+import time
+try:
+    from .ksconstants import STATCODE, CMDCODE
+except ImportError:
+    from ksconstants import STATCODE, CMDCODE
+
+# 개폐기 위치 추정기
+# 마지막 명령과 경과 시간으로 개도율을 추정하고, 실제 상태를 읽었을 때 보정합니다.
+# 이동 속도(%/초)는 OPENING/CLOSING 중에 관측된 개도율 변화로부터 학습합니다.
+# 개도율 레지스터는 정수(%)이므로 값이 바뀌지 않은 관측으로는 속도를 알 수 없습니다.
+# 그래서 값이 바뀐 관측을 기준(anchor)으로 잡아 두고, 다음에 값이 바뀌었을 때
+# 기준으로부터의 변화량/경과시간으로 학습합니다.
+
+class TravelState:
+    def __init__(self, rate):
+        self.position = 0.0     # 마지막 기준 개도율 (%)
+        self.since = None       # 기준 시각
+        self.direction = 0      # 1: 여는중, -1: 닫는중, 0: 정지
+        self.target = None      # 목표 개도율
+        self.rate = rate        # 이동 속도 (%/초)
+        self.learned = False
+        self.lastread = None    # 마지막으로 실제 상태를 읽은 시각
+        self.sample = None      # 이동 중 기준 관측 (시각, 개도율, 방향, 값이 바뀐 관측인지)
+
+
+class PositionEstimator:
+    def __init__(self, ndevices, rate=1.0, alpha=0.3, interval=30):
+        self.states = [TravelState(rate) for _ in range(ndevices)]
+        self.alpha = alpha          # 속도 학습 가중치
+        self.interval = interval    # 이동 중 실제 상태를 다시 읽는 주기 (초)
+
+    def _freeze(self, st, now):
+        # 현재 추정 위치를 새로운 기준으로 삼습니다.
+        st.position = self._estimate(st, now)
+        st.since = now
+
+    def _estimate(self, st, now):
+        if st.direction == 0 or st.since is None:
+            return st.position
+        pos = st.position + st.direction * st.rate * (now - st.since)
+        if st.target is not None:
+            pos = min(pos, st.target) if st.direction > 0 else max(pos, st.target)
+        return min(max(pos, 0.0), 100.0)
+
+    def on_command(self, devidx, cmd, sec=None, pos=None, now=None):
+        now = time.time() if now is None else now
+        st = self.states[devidx]
+        self._freeze(st, now)
+        st.sample = None
+
+        if cmd == CMDCODE.OPEN:
+            st.direction, st.target = 1, 100.0
+        elif cmd == CMDCODE.CLOSE:
+            st.direction, st.target = -1, 0.0
+        elif cmd == CMDCODE.TIMED_OPEN:
+            st.direction, st.target = 1, min(100.0, st.position + st.rate * sec)
+        elif cmd == CMDCODE.TIMED_CLOSE:
+            st.direction, st.target = -1, max(0.0, st.position - st.rate * sec)
+        elif cmd == CMDCODE.SET_POSITION:
+            st.target = float(pos)
+            st.direction = (st.target > st.position) - (st.target < st.position)
+        else:
+            st.direction, st.target = 0, None
+
+    def observe(self, devidx, stat, position, now=None):
+        now = time.time() if now is None else now
+        st = self.states[devidx]
+
+        if stat == STATCODE.OPENING:
+            direction = 1
+        elif stat == STATCODE.CLOSING:
+            direction = -1
+        else:
+            direction = 0
+
+        anchor = st.sample
+        if direction == 0:
+            st.sample = None
+        elif anchor is None or anchor[2] != direction:
+            # 이동을 처음 관측했습니다. 이 관측이 개도율이 바뀐 시점은 아니므로 학습에는 쓰지 않습니다.
+            st.sample = (now, position, direction, False)
+        elif position != anchor[1]:
+            # 같은 방향으로 이동 중 값이 바뀌었습니다. 두 기준 모두 값이 바뀐 시점이면 속도를 학습합니다.
+            dt = now - anchor[0]
+            moved = (position - anchor[1]) * direction
+            if anchor[3] and dt > 0 and moved > 0:
+                rate = moved / dt
+                st.rate = rate if not st.learned else (1 - self.alpha) * st.rate + self.alpha * rate
+                st.learned = True
+            st.sample = (now, position, direction, True)
+        # 값이 그대로면 기준을 유지합니다.
+
+        if st.sample is not None and st.sample[3]:
+            # 값이 바뀐 시점부터 추정하면 정수 레지스터의 소수점 아래 진행분을 잃지 않습니다.
+            st.position = float(st.sample[1])
+            st.since = st.sample[0]
+        else:
+            st.position = float(position)
+            st.since = now
+        st.lastread = now
+        if direction == 0:
+            st.target = None
+        elif st.direction != direction:
+            st.target = 100.0 if direction > 0 else 0.0
+        st.direction = direction
+
+    def position(self, devidx, now=None):
+        now = time.time() if now is None else now
+        return self._estimate(self.states[devidx], now)
+
+    def moving(self, devidx, now=None):
+        st = self.states[devidx]
+        return st.direction != 0 and self.position(devidx, now) != st.target
+
+    def time_to_target(self, devidx, now=None):
+        st = self.states[devidx]
+        if st.direction == 0 or st.target is None:
+            return 0.0
+        return abs(st.target - self.position(devidx, now)) / st.rate
+
+    def needs_reconcile(self, devidx, now=None):
+        # 이동 중에는 일정 주기마다, 그리고 목표에 도달했다고 추정될 때 실제 상태를 읽습니다.
+        now = time.time() if now is None else now
+        st = self.states[devidx]
+        if st.direction == 0:
+            return st.lastread is None
+        if st.lastread is None or now - st.lastread >= self.interval:
+            return True
+        return not self.moving(devidx, now)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2025 tombraid@snu.ac.kr
+# All right reserved.
+#
+import time
+import itertools
+try:
+    from .ksconstants import STATCODE, PRIVCODE
+except ImportError:
+    from ksconstants import STATCODE, PRIVCODE
+
+# 제어권 감시기
+# 모든 노드의 201번지(노드상태, OPID, 제어권)를 주기적으로 한 번에 읽어 제어권을 캐시합니다.
+# 원격제어(REMOTE)가 아닌 노드로 가는 명령은 전송하지 않고 거부하거나 대기열에 넣습니다.
+# 대기열에는 주소(key)마다 마지막 명령만 남기고, expire 초가 지난 명령은 버립니다.
+# 대기열에는 레지스터 값이 아니라 명령을 만드는 함수를 넣으므로, 다시 전송할 때 새 OPID 가 붙습니다.
+# 제어권은 명령을 보낼 때에도 확인하지만, 대기열을 쓰는 제어 루프는 매 주기마다 poll() 을 불러
+# 다른 명령이 없더라도 원격제어로 돌아온 노드의 대기 명령이 유효 시간 안에 전송되도록 해야 합니다.
+
+class PrivilegeMonitor:
+    def __init__(self, client, units=(2, 3, 4, 5), interval=10, queue=False, expire=60, onchange=None):
+        self.client = client
+        self.units = list(units)
+        self.interval = interval    # 제어권 확인 주기 (초)
+        self.queue = queue          # True 이면 원격제어가 아닐 때 명령을 대기열에 넣습니다.
+        self.expire = expire        # 대기열 명령의 유효 시간 (초)
+        self.onchange = onchange    # onchange(unit, old, new)
+        self.privs = {unit: None for unit in self.units}
+        self.pending = {unit: {} for unit in self.units}    # key -> (넣은 시각, func, args, kwargs)
+        self.lastsweep = None
+        self.seq = itertools.count()
+
+    def get_priv_name(self, priv):
+        ptbl = {
+            PRIVCODE.LOCAL: "로컬제어",
+            PRIVCODE.REMOTE: "원격제어",
+            PRIVCODE.MANUAL: "수동제어"
+        }
+        return ptbl.get(priv, "알수없음")
+
+    def sweep(self):
+        # 모든 노드의 제어 블록을 한 번에 훑습니다.
+        for unit in self.units:
+            reg = self.client.read_holding_registers(201, count=3, device_id=unit)
+            if reg.isError() or reg.registers[0] != STATCODE.READY:
+                priv = None
+            else:
+                priv = reg.registers[2]
+            self._update(unit, priv)
+        self.lastsweep = time.time()
+
+    def maybe_sweep(self):
+        if self.lastsweep is None or time.time() - self.lastsweep >= self.interval:
+            self.sweep()
+
+    def poll(self):
+        # 제어 루프에서 매 주기마다 부릅니다. interval 마다 제어권을 확인하고 대기 명령을 전송합니다.
+        self.maybe_sweep()
+
+    def _update(self, unit, priv):
+        old = self.privs.get(unit)
+        self.privs[unit] = priv
+        if old != priv:
+            print(f"{unit}번 노드의 제어권이 {self.get_priv_name(old)}에서 {self.get_priv_name(priv)}(으)로 바뀌었습니다.")
+            if self.onchange is not None:
+                self.onchange(unit, old, priv)
+        if priv == PRIVCODE.REMOTE:
+            self.flush(unit)
+
+    def is_remote(self, unit):
+        self.maybe_sweep()
+        return self.privs.get(unit) == PRIVCODE.REMOTE
+
+    def submit(self, unit, func, *args, key=None, **kwargs):
+        # 원격제어 상태이면 바로 실행하고 True 를 반환합니다.
+        # key 는 명령 블록 주소처럼 같은 대상을 가리키는 값으로, 대기열에는 key 마다 마지막 명령만 남습니다.
+        # 제어권을 확인하다 대기열이 전송되더라도 이 명령이 대신하는 이전 명령은 보내지 않도록 먼저 뺍니다.
+        replaced = None
+        if key is not None:
+            replaced = self.pending.setdefault(unit, {}).pop(key, None)
+
+        if self.is_remote(unit):
+            func(*args, **kwargs)
+            return True
+
+        if self.queue:
+            pending = self.pending.setdefault(unit, {})
+            if key is None:
+                key = next(self.seq)
+            elif replaced is not None:
+                print(f"{unit}번 노드의 대기중인 명령({key})을 새 명령으로 바꿉니다.")
+            pending[key] = (time.time(), func, args, kwargs)
+            print(f"{unit}번 노드가 {self.get_priv_name(self.privs.get(unit))} 상태입니다. 명령을 대기열에 넣습니다.")
+        else:
+            print(f"{unit}번 노드가 {self.get_priv_name(self.privs.get(unit))} 상태입니다. 명령을 전송하지 않습니다.")
+        return False
+
+    def flush(self, unit):
+        # 원격제어로 돌아오면 유효 시간이 남은 명령을 넣은 순서대로 전송합니다.
+        pending, self.pending[unit] = self.pending.get(unit, {}), {}
+        now = time.time()
+        for key, (queued, func, args, kwargs) in pending.items():
+            if now - queued > self.expire:
+                print(f"{unit}번 노드의 대기중인 명령({key})이 {int(now - queued)}초 지나 버립니다.")
+                continue
+            func(*args, **kwargs)
@@ -7,15 +7,20 @@
 #
 
 import time
-import struct
-import json
-from pymodbus.client import ModbusTcpClient
-from ksconstants import STATCODE, CMDCODE, PRIVCODE
+try:
+    from .ksconstants import STATCODE, CMDCODE, PRIVCODE
+    from .connection import ModbusDevice, load_config
+    from .frames import SENSOR, words2float
+except ImportError:
+    from ksconstants import STATCODE, CMDCODE, PRIVCODE
+    from connection import ModbusDevice, load_config
+    from frames import SENSOR, words2float
 
 def getobservation(reg1, reg2):
-    return struct.unpack('f', struct.pack('HH', reg1, reg2))[0]
+    return words2float(reg1, reg2)
 
 def readsensor(client, item):
+    # 정상 관측치를 반환하고, 실패하거나 비정상이면 None 을 반환합니다.
     res = client.read_holding_registers(item["start-address"], count=3, device_id=item["unit"])
     if res.isError():
         print ("정보를 읽어오는데 실패했습니다.")
@@ -25,13 +30,18 @@ def readsensor(client, item):
         if reg[2] == STATCODE.READY:
             val = getobservation(reg[0], reg[1])
             print ("{} 센서의 상태는 정상이고, 관측치는 {} 입니다.".format(item["name"], val))
+            return val
         else:
             print ("{} 센서의 상태가 비정상입니다.".format(item["name"]))
+    return None
 
-
-# Load configuration
-with open('conf.json', 'r') as f:
-    config = json.load(f)
+def readsensor_raw(reader, item):
+    # readsensor 와 같지만 frames.RawReader 로 읽어 레지스터 리스트를 만들지 않습니다.
+    buf = reader.read(item["start-address"], 3, item["unit"])
+    if buf is None:
+        return None
+    val, stat = SENSOR.unpack_from(buf)
+    return val if stat == STATCODE.READY else None
 
 devices = [
     {"unit": 2, "start-address": 203, "name": "기상대-온도"},
@@ -51,12 +61,20 @@ devices = [
     {"unit": 5, "start-address": 225, "name": "양액-누적유량"}
 ]
 
-client = ModbusTcpClient(config['modbus_ip'], port=config['modbus_port'])
-client.connect()
+def readall(reader, interval=1):
+    # 한 번의 폴링 결과를 이름별로 모읍니다. (extra/derived.py 의 DerivedMetrics.update 입력)
+    # 자주 부르는 경로이므로 frames.RawReader (ModbusDevice.reader) 로 읽습니다.
+    observations = {}
+    for dev in devices:
+        observations[dev["name"]] = readsensor_raw(reader, dev)
+        time.sleep(interval)
+    return observations
 
-for dev in devices:
-    readsensor(client, dev)
-    time.sleep(1)
+if __name__ == "__main__":
+    config = load_config()
+    with ModbusDevice(config['modbus_ip'], config['modbus_port']) as conn:
+        for name, val in readall(conn.reader).items():
+            print(f"{name} : {val}")
 
 
 """
@@ -7,17 +7,29 @@
 #
 import time
 import struct
-import json
-from pymodbus.client import ModbusTcpClient
-from ksconstants import STATCODE, CMDCODE, PRIVCODE
-
-class RetractableTester:
-    def __init__(self, ip, port):
-        self.client = ModbusTcpClient(ip, port=port)
-        self.client.connect()
+try:
+    from .ksconstants import STATCODE, CMDCODE, PRIVCODE
+    from .position import PositionEstimator
+    from .connection import ModbusDevice, load_config
+    from .tracing import now_us
+    from .frames import RETRACTABLE, words2int
+except ImportError:
+    from ksconstants import STATCODE, CMDCODE, PRIVCODE
+    from position import PositionEstimator
+    from connection import ModbusDevice, load_config
+    from tracing import now_us
+    from frames import RETRACTABLE, words2int
+
+class RetractableTester(ModbusDevice):
+    def __init__(self, ip, port, monitor=None, client=None, tracer=None):
+        super().__init__(ip, port, client)
+        self.tracer = tracer
         self.devices = ['천창좌', '천창우', '스크린', '보온커튼']
         self.opid = 1
+        self.monitor = monitor
         self.idx = 0
+        self.devidx = 0
+        self.estimator = PositionEstimator(len(self.devices))
 
     def get_command_name(self, cmd):
         ctbl = {
@@ -31,25 +43,37 @@ class RetractableTester:
         return ctbl.get(cmd, "없는 명령")
 
     def send_command(self, cmd, sec=None, pos=None):
+        if cmd in (CMDCODE.TIMED_OPEN, CMDCODE.TIMED_CLOSE) and sec is None:
+            print(f"{self.get_command_name(cmd)} 명령은 시간을 필요로 합니다.")
+            return
+        if cmd == CMDCODE.SET_POSITION and pos is None:
+            print(f"{self.get_command_name(cmd)} 명령은 위치를 필요로 합니다.")
+            return
+
+        # 제어권 감시기가 있으면 원격제어 상태일 때만 전송합니다.
+        # 대기열에 들어간 명령은 원격제어로 돌아올 때 issue_command 로 새 OPID 를 받아 전송됩니다.
+        self.queued = now_us()
+        try:
+            if self.monitor is None:
+                self.issue_command(self.idx, self.devidx, cmd, sec, pos)
+            else:
+                self.monitor.submit(4, self.issue_command, self.idx, self.devidx, cmd, sec, pos, key=500 + self.idx)
+        finally:
+            self.queued = None
+
+    def issue_command(self, idx, devidx, cmd, sec=None, pos=None):
         self.opid += 1
         reg = [cmd, self.opid]
 
         if cmd in (CMDCODE.TIMED_OPEN, CMDCODE.TIMED_CLOSE):
-            if sec is not None:
-                reg.extend(struct.unpack('HH', struct.pack('i', sec)))
-            else:
-                print(f"{self.get_command_name(cmd)} 명령은 시간을 필요로 합니다.")
-                return
+            reg.extend(struct.unpack('HH', struct.pack('i', sec)))
 
         if cmd == CMDCODE.SET_POSITION:
-            if pos is not None:
-                reg.extend([0, 0, pos])
-            else:
-                print(f"{self.get_command_name(cmd)} 명령은 위치를 필요로 합니다.")
-                return
+            reg.extend([0, 0, pos])
 
         print(f"{self.get_command_name(cmd)} 명령을 전송합니다. {reg}")
-        self.client.write_registers(500 + self.idx, reg, device_id=4)
+        self.write_registers(500 + idx, reg, 4)
+        self.estimator.on_command(devidx, cmd, sec=sec, pos=pos)
 
     def get_status_name(self, stat):
         ctbl = {
@@ -60,23 +84,34 @@ class RetractableTester:
         return ctbl.get(stat, "없는 상태")
 
     def get_remain_time(self, reg1, reg2):
-        return struct.unpack('i', struct.pack('HH', reg1, reg2))[0]
+        return words2int(reg1, reg2)
 
     def read_status(self, readtime=False):
-        reg = self.client.read_holding_registers(200 + self.idx, count=5, device_id=4)
-        if not reg.isError():
-            if reg.registers[0] == self.opid:
-                print(f"OPID {self.opid} 번 명령으로 {self.get_status_name(reg.registers[1])} 입니다. 개도율은 {reg.registers[4]} 입니다.")
-                if reg.registers[1] != 0 and readtime:
-                    print(f"작동 남은 시간은 {self.get_remain_time(reg.registers[2], reg.registers[3])} 입니다.")
+        start = now_us()
+        buf = self.reader.read(200 + self.idx, 5, 4)
+        if buf is not None:
+            opid, stat, remain, position = RETRACTABLE.unpack_from(buf)
+            self.trace_status(4, 500 + self.idx, opid, stat, start)
+            if opid == self.opid:
+                self.estimator.observe(self.devidx, stat, position)
+                print(f"OPID {self.opid} 번 명령으로 {self.get_status_name(stat)} 입니다. 개도율은 {position} 입니다.")
+                if stat != 0 and readtime:
+                    print(f"작동 남은 시간은 {remain} 입니다.")
             else:
-                print(f"OPID가 매치되지 않습니다. 레지스터값은 {reg.registers[0]}, 기대하고 있는 값은 {self.opid} 입니다.")
+                print(f"OPID가 매치되지 않습니다. 레지스터값은 {opid}, 기대하고 있는 값은 {self.opid} 입니다.")
         else:
             print("상태 읽기 실패")
 
+    def get_position(self):
+        # 추정 위치를 반환하고, 보정이 필요할 때만 실제 상태를 읽습니다.
+        if self.estimator.needs_reconcile(self.devidx):
+            self.read_status()
+        return self.estimator.position(self.devidx), self.estimator.time_to_target(self.devidx)
+
     def run_single_test(self, devidx, devname):
         print(f"\n===== {devname}({devidx}) 장비 테스트 시작 =====\n")
         self.idx = 67 + 5 * devidx
+        self.devidx = devidx
 
         # Initialize
         self.send_command(CMDCODE.OFF)
@@ -137,13 +172,11 @@ class RetractableTester:
     def run_all_tests(self):
         for devidx, devname in enumerate(self.devices):
             self.run_single_test(devidx, devname)
-        self.client.close()
+        self.close()
 
 if __name__ == "__main__":
-    with open('conf.json', 'r') as f:
-        config = json.load(f)
-
-    tester = RetractableTester(config['modbus_ip'], config['modbus_port'])
-    tester.run_all_tests()
+    config = load_config()
+    with RetractableTester(config['modbus_ip'], config['modbus_port']) as tester:
+        tester.run_all_tests()
 
 
@@ -7,16 +7,24 @@
 #
 import time
 import struct
-import json
-from pymodbus.client import ModbusTcpClient
-from ksconstants import STATCODE, CMDCODE
-
-class SwitchTester:
-    def __init__(self, ip, port):
-        self.client = ModbusTcpClient(ip, port=port)
-        self.client.connect()
+try:
+    from .ksconstants import STATCODE, CMDCODE
+    from .connection import ModbusDevice, load_config
+    from .tracing import now_us
+    from .frames import SWITCH, words2int
+except ImportError:
+    from ksconstants import STATCODE, CMDCODE
+    from connection import ModbusDevice, load_config
+    from tracing import now_us
+    from frames import SWITCH, words2int
+
+class SwitchTester(ModbusDevice):
+    def __init__(self, ip, port, monitor=None, client=None, tracer=None):
+        super().__init__(ip, port, client)
+        self.tracer = tracer
         self.devices = ['FCU팬', 'FCU순환', 'CO2', '유동팬', 'FOG']
         self.opid = 1
+        self.monitor = monitor
         self.idx = 0
 
     def get_command_name(self, cmd):
@@ -28,6 +36,18 @@ class SwitchTester:
         return ctbl.get(cmd, "없는 명령")
 
     def send_command(self, cmd, sec=None):
+        # 제어권 감시기가 있으면 원격제어 상태일 때만 전송합니다.
+        # 대기열에 들어간 명령은 원격제어로 돌아올 때 issue_command 로 새 OPID 를 받아 전송됩니다.
+        self.queued = now_us()
+        try:
+            if self.monitor is None:
+                self.issue_command(self.idx, cmd, sec)
+            else:
+                self.monitor.submit(4, self.issue_command, self.idx, cmd, sec, key=500 + self.idx)
+        finally:
+            self.queued = None
+
+    def issue_command(self, idx, cmd, sec=None):
         self.opid += 1
         reg = [cmd, self.opid]
 
@@ -35,7 +55,7 @@ class SwitchTester:
             reg.extend(struct.unpack('HH', struct.pack('i', sec)))
 
         print(f"{self.get_command_name(cmd)} 명령을 전송합니다. {reg}")
-        self.client.write_registers(500 + self.idx, reg, device_id=4)
+        self.write_registers(500 + idx, reg, 4)
 
     def get_status_name(self, stat):
         ctbl = {
@@ -45,18 +65,21 @@ class SwitchTester:
         return ctbl.get(stat, "없는 상태")
 
     def get_remain_time(self, reg1, reg2):
-        return struct.unpack('i', struct.pack('HH', reg1, reg2))[0]
+        return words2int(reg1, reg2)
 
     def read_status(self, readtime=False):
-        reg = self.client.read_holding_registers(200 + self.idx, count=4, device_id=4)
-        if not reg.isError():
-            print(reg.registers)
-            if reg.registers[0] == self.opid:
-                print(f"OPID {self.opid} 번 명령으로 {self.get_status_name(reg.registers[1])} 입니다.")
-                if reg.registers[1] != 0 and readtime:
-                    print(f"작동 남은 시간은 {self.get_remain_time(reg.registers[2], reg.registers[3])} 입니다.")
+        start = now_us()
+        buf = self.reader.read(200 + self.idx, 4, 4)
+        if buf is not None:
+            opid, stat, remain = SWITCH.unpack_from(buf)
+            self.trace_status(4, 500 + self.idx, opid, stat, start)
+            print((opid, stat, remain))
+            if opid == self.opid:
+                print(f"OPID {self.opid} 번 명령으로 {self.get_status_name(stat)} 입니다.")
+                if stat != 0 and readtime:
+                    print(f"작동 남은 시간은 {remain} 입니다.")
             else:
-                print(f"OPID가 매치되지 않습니다. 레지스터값은 {reg.registers[0]}, 기대하고 있는 값은 {self.opid} 입니다.")
+                print(f"OPID가 매치되지 않습니다. 레지스터값은 {opid}, 기대하고 있는 값은 {self.opid} 입니다.")
         else:
             print("상태 읽기 실패")
 
@@ -97,13 +120,11 @@ class SwitchTester:
     def run_all_tests(self):
         for devidx, devname in enumerate(self.devices):
             self.run_single_test(devidx, devname)
-        self.client.close()
+        self.close()
 
 if __name__ == "__main__":
-    with open('conf.json', 'r') as f:
-        config = json.load(f)
-    
-    tester = SwitchTester(config['modbus_ip'], config['modbus_port'])
-    tester.run_all_tests()
+    config = load_config()
+    with SwitchTester(config['modbus_ip'], config['modbus_port']) as tester:
+        tester.run_all_tests()
 
 
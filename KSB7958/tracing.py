@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2025 tombraid@snu.ac.kr
+# All right reserved.
+#
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# 제어 지연 추적
+# 제어 주기와 명령마다 구간(span)을 열고, 명령 구간은 (유닛, 주소, OPID) 로 찾아
+# send_command 와 read_status 를 연결합니다. 명령 구간은 다음 단계로 나뉩니다.
+#   dispatch   : send_command 에 들어온 시각부터 전송을 시작할 때까지 (제어권 확인, 연결 포함)
+#   gateway    : write_registers 왕복 시간
+#   actuation  : 전송 완료부터 상태 레지스터에 OPID 와 작동 상태가 나타날 때까지
+# 결과는 Chrome Trace Event 형식(JSON 배열)으로 저장되어 chrome://tracing 이나 Perfetto 에서 볼 수 있습니다.
+
+def now_us():
+    return time.perf_counter_ns() // 1000
+
+class Tracer:
+    def __init__(self, path='trace.json', timeout=120):
+        self.path = path
+        self.timeout = timeout      # 이 시간(초) 안에 응답이 없으면 명령 구간을 닫습니다.
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.file = None
+        self.commands = {}
+        self.cycle = 0
+
+    def _emit(self, event):
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, 'w')
+                self.file.write('[\n')
+            self.file.write(json.dumps(event, ensure_ascii=False) + ',\n')
+
+    def span(self, name, start, end, cat, tid=0, args=None):
+        self._emit({"name": name, "cat": cat, "ph": "X", "ts": start, "dur": max(end - start, 0),
+                    "pid": self.pid, "tid": tid, "args": args or {}})
+
+    @contextmanager
+    def control_cycle(self, name='control-cycle', **args):
+        self.cycle += 1
+        start = now_us()
+        try:
+            yield self.cycle
+        finally:
+            self.span(name, start, now_us(), 'cycle', args=dict(args, cycle=self.cycle))
+
+    @contextmanager
+    def phase(self, name, **args):
+        # 센서 읽기, 판단 등 제어 주기 안의 임의 구간
+        start = now_us()
+        try:
+            yield
+        finally:
+            self.span(name, start, now_us(), 'phase', args=args)
+
+    def command_sent(self, unit, address, opid, cmd, queued, sent, done):
+        # queued: send_command 에 들어온 시각, sent: 전송을 시작한 시각, done: 응답을 받은 시각
+        self.commands[(unit, address, opid)] = {"cmd": cmd, "queued": queued, "sent": sent, "done": done}
+        self.expire()
+
+    def status_read(self, unit, address, opid, stat, start, end):
+        # OPID 가 맞는 상태를 처음 읽으면 명령 구간을 닫습니다.
+        key = (unit, address, opid)
+        cmdinfo = self.commands.get(key)
+        if cmdinfo is None or stat is None:
+            return
+        if stat == 0 and cmdinfo["cmd"] != 0:
+            return
+        del self.commands[key]
+        self._close(key, cmdinfo, end, {"stat": stat, "read_rtt_us": end - start})
+
+    def _close(self, key, cmdinfo, end, args):
+        unit, address, opid = key
+        tid = unit * 1000 + address
+        name = f"cmd {cmdinfo['cmd']} u{unit}@{address}"
+        args = dict(args, unit=unit, address=address, opid=opid, cmd=cmdinfo["cmd"])
+        self.span(name, cmdinfo["queued"], end, 'command', tid, args)
+        self.span('dispatch', cmdinfo["queued"], cmdinfo["sent"], 'command', tid, {"opid": opid})
+        self.span('gateway', cmdinfo["sent"], cmdinfo["done"], 'command', tid, {"opid": opid})
+        self.span('actuation', cmdinfo["done"], end, 'command', tid, {"opid": opid})
+
+    def expire(self):
+        limit = now_us() - self.timeout * 1000000
+        for key in [k for k, v in self.commands.items() if v["done"] < limit]:
+            self._close(key, self.commands.pop(key), now_us(), {"timeout": True})
+
+    def close(self):
+        for key in list(self.commands):
+            self._close(key, self.commands.pop(key), now_us(), {"unfinished": True})
+        with self.lock:
+            if self.file is not None:
+                # 마지막 쉼표 뒤에도 읽을 수 있도록 빈 메타데이터 이벤트로 배열을 닫습니다.
+                self.file.write(json.dumps({"name": "trace-end", "ph": "M", "pid": self.pid, "args": {}}) + '\n]\n')
+                self.file.close()
+                self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
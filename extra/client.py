@@ -1,22 +1,66 @@
+import asyncio
 import httpx
 import json
 import logging
 import os
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Iterable
+from forecast import Forecast, ForecastLog
+from ratelimit import RequestScheduler
+from imagestore import ImageStore
+from preprocess import ImagePipeline
 
 class ExtraClient:
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], pipeline: Optional[ImagePipeline] = None):
         self.name = config.get("name")
         self.base_url = config.get("url")
         self.apikey = config.get("apikey")
         self.dataids = config.get("dataids_for_camera", [])
+        self.forecast: Optional[Forecast] = None
+        self.forecasts: Dict[int, Forecast] = {}
+        self.scheduler = RequestScheduler(config.get("limits"))
+        self.images = ImageStore(**config.get("image_store", {}))
+        self.pipeline = pipeline
+        self.max_connections = (config.get("limits") or {}).get("concurrency", 4)
+        self._http: Optional[httpx.AsyncClient] = None
 
-    async def _make_request(self, method: str, endpoint: str, **kwargs):
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """The connection pool shared by every request, created on first use."""
+        if self._http is None or self._http.is_closed:
+            limits = httpx.Limits(max_connections=self.max_connections,
+                                  max_keepalive_connections=self.max_connections)
+            self._http = httpx.AsyncClient(limits=limits)
+        return self._http
+
+    async def aclose(self):
+        """Close the shared connection pool and shut down the preprocessing workers."""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        if self.pipeline is not None:
+            self.pipeline.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def _make_request(self, method: str, endpoint: str, allow_not_modified: bool = False, farm_id: int = None, **kwargs):
         """Make a request to the API.
 
+        The request waits for a slot from the scheduler, so control endpoints
+        (/target, /heartbeat) go ahead of bulk transfers (/image, /forecast)
+        and each endpoint stays within its rate limit for the farm. Requests over the rate
+        limit wait in the queue; the lane timeout bounds the wait for a
+        concurrency slot and, separately, the request itself.
+
         Args:
             method: The HTTP method to use.
             endpoint: The API endpoint to call.
+            allow_not_modified: Return a 304 Not Modified response instead of
+                                raising, for conditional requests.
+            farm_id: The farm the request is for, which selects its rate limit.
             **kwargs: Additional keyword arguments to pass to httpx.
 
         Returns:
@@ -24,19 +68,24 @@ class ExtraClient:
 
         Raises:
             ValueError: If the API key is not configured.
+            asyncio.TimeoutError: If no concurrency slot was granted in time.
         """
         if not self.apikey:
             error_msg = f"API key not configured for {self.name}"
             raise ValueError(error_msg)
 
-        headers = {"X-API-KEY": self.apikey}
+        headers = {"X-API-KEY": self.apikey, **kwargs.pop("headers", {})}
         url = f"{self.base_url}{endpoint}"
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.request(method, url, headers=headers, **kwargs)
-                response.raise_for_status()
+            async with self.scheduler.slot(endpoint, farm_id) as lane:
+                response = await self.http.request(method, url, headers=headers, timeout=lane.timeout, **kwargs)
+                if not (allow_not_modified and response.status_code == 304):
+                    response.raise_for_status()
                 return response
+        except asyncio.TimeoutError:
+            logging.error(f"Timed out waiting for a request slot for {url!r}")
+            raise
         except httpx.RequestError as exc:
             logging.error(f"An error occurred while requesting {exc.request.url!r}: {exc}")
             raise
@@ -52,7 +101,10 @@ class ExtraClient:
             data_id: The ID of the data.
 
         Returns:
-            The content of the response.
+            A dictionary with image_path, image_data, filename, the content hash
+            and unchanged (True when the stored frame was reused). When a pipeline
+            is configured and the frame is new, "preprocessed" holds the paths of
+            the memory-mapped arrays written by the pipeline.
 
         Raises:
             ValueError: If data_id is None.
@@ -63,8 +115,30 @@ class ExtraClient:
             raise ValueError(error_msg)
         params = {"farm_id": farm_id, "data_id": data_id}
 
-        response = await self._make_request("GET", endpoint, params=params)
-        
+        # Ask the server to skip the download if the latest frame is already stored.
+        # The entry is kept so a 304 refers to the frame the headers were built from.
+        entry = self.images.lookup(farm_id, data_id)
+        headers = self.images.conditional_headers(farm_id, data_id)
+        response = await self._make_request("GET", endpoint, params=params, headers=headers,
+                                            allow_not_modified=True, farm_id=farm_id)
+
+        if response.status_code == 304:
+            image_data = None if entry is None else self.images.read_object(entry["hash"])
+            if image_data is not None:
+                image_path = os.path.join(self.images.root, entry["filename"])
+                print(f"Image unchanged: {image_path}")
+                return {
+                    "image_path": image_path,
+                    "image_data": image_data,
+                    "filename": os.path.basename(entry["filename"]),
+                    "hash": entry["hash"],
+                    "unchanged": True
+                }
+            # The frame was evicted while the request was in flight, or the server
+            # answered 304 without being asked: download it again unconditionally.
+            logging.warning(f"Got 304 for data_id {data_id} without a stored frame; downloading it again")
+            response = await self._make_request("GET", endpoint, params=params, farm_id=farm_id)
+
         # The response is now directly the image data
         image_data = response.content
         
@@ -87,37 +161,109 @@ class ExtraClient:
                 ext = '.webp'
             filename = f"image_{data_id}{ext}"
         
-        image_path = f"images/{filename}"
-        
-        # Create images directory if it doesn't exist
-        os.makedirs("images", exist_ok=True)
-        
-        # Save image to file
-        with open(image_path, "wb") as f:
-            f.write(image_data)
-            
-        print(f"Image saved to: {image_path}")
+        # Save image into the content-addressed store; identical frames share one object
+        stored = self.images.put(
+            farm_id, data_id, filename, image_data,
+            etag=response.headers.get('etag'),
+            last_modified=response.headers.get('last-modified')
+        )
+        image_path = stored["image_path"]
+
+        if stored["unchanged"]:
+            print(f"Image unchanged: {image_path}")
+        else:
+            print(f"Image saved to: {image_path}")
+
+        result = {"image_path": image_path, "image_data": image_data, "filename": filename,
+                  "hash": stored["hash"], "unchanged": stored["unchanged"]}
+
+        # Decode and resize on the process pool so the event loop stays free.
+        # The arrays are named after the image file, which is reused for every
+        # frame of a camera, so only an unchanged frame may reuse them. They are
+        # kept per farm like the images, since data IDs may repeat across farms.
+        name = os.path.join(str(farm_id), os.path.splitext(os.path.basename(filename))[0])
+        if self.pipeline is not None and (not stored["unchanged"] or not os.path.exists(self.pipeline.array_path(image_path, name))):
+            try:
+                result["preprocessed"] = await self.pipeline.process(image_path, name)
+            except (OSError, ImportError) as e:
+                logging.error(f"Failed to preprocess {image_path}: {e}")
+                result["preprocessed"] = None
         
-        return {"image_path": image_path, "image_data": image_data, "filename": filename}
+        return result
 
-    async def get_forecast(self):
+    async def get_forecast(self, farm_id: int = None):
         """Get the forecast from the API.
 
+        The forecast is also parsed into a Forecast, kept in self.forecast and
+        saved to forecasts/forecast.npz so that load_forecast() can restore it.
+        With a farm_id, the files are forecasts/forecast_<farm_id>.* and the
+        parsed forecast is kept in self.forecasts[farm_id]. Every forecast is
+        also appended to forecast_log(farm_id) for the dataset exporter.
+
+        Args:
+            farm_id: The ID of the farm. The server default is used if None.
+
         Returns:
             The forecast data.
         """
         endpoint = "/forecast"
-        response = await self._make_request("GET", endpoint)
+        params = {"farm_id": farm_id} if farm_id is not None else None
+        stem = "forecasts/forecast" if farm_id is None else f"forecasts/forecast_{farm_id}"
+        response = await self._make_request("GET", endpoint, params=params, farm_id=farm_id)
         try:
             forecast_data = json.loads(response.text)
-            with open("forecasts/forecast.json", "w") as f:
+            os.makedirs("forecasts", exist_ok=True)
+            with open(f"{stem}.json", "w") as f:
                 json.dump(forecast_data, f, indent=4)
-            return forecast_data
         except (json.JSONDecodeError, SyntaxError) as e:
             error_msg = f"Failed to decode JSON from response. Status code: {response.status_code}, Response text: {response.text}"
             logging.error(error_msg)
             raise e
 
+        try:
+            forecast = Forecast.from_json(forecast_data)
+            forecast.save(f"{stem}.npz")
+            self.forecast_log(farm_id).append(forecast)
+            if farm_id is None:
+                self.forecast = forecast
+            else:
+                self.forecasts[farm_id] = forecast
+        except ValueError as e:
+            logging.warning(f"Failed to index forecast data: {e}")
+        return forecast_data
+
+    def forecast_log(self, farm_id: int = None) -> ForecastLog:
+        """Return the log of every forecast fetched for a farm.
+
+        Args:
+            farm_id: The ID of the farm, or None for the server default.
+
+        Returns:
+            The ForecastLog under forecasts/log (or forecasts/log_<farm_id>).
+        """
+        return ForecastLog("forecasts/log" if farm_id is None else f"forecasts/log_{farm_id}")
+
+    def load_forecast(self, path: str = None, farm_id: int = None) -> Optional[Forecast]:
+        """Load the last indexed forecast saved by get_forecast.
+
+        Args:
+            path: The path of the saved forecast. Defaults to forecasts/forecast.npz,
+                  or forecasts/forecast_<farm_id>.npz with a farm_id.
+            farm_id: The ID of the farm. The forecast is kept in self.forecasts[farm_id].
+
+        Returns:
+            The loaded forecast, or None if it has not been saved yet.
+        """
+        if path is None:
+            path = "forecasts/forecast.npz" if farm_id is None else f"forecasts/forecast_{farm_id}.npz"
+        if farm_id is None:
+            if os.path.exists(path):
+                self.forecast = Forecast.load(path)
+            return self.forecast
+        if os.path.exists(path):
+            self.forecasts[farm_id] = Forecast.load(path)
+        return self.forecasts.get(farm_id)
+
     async def post_heartbeat(self, content: str, farm_id: int = 1, category: str = "ai", created_time: str = None):
         """Post a heartbeat to the API.
 
@@ -139,7 +285,7 @@ class ExtraClient:
         if created_time:
             data["created_time"] = created_time
 
-        response = await self._make_request("POST", endpoint, json=data)
+        response = await self._make_request("POST", endpoint, json=data, farm_id=farm_id)
         return response
 
     async def post_target(self, target_data: List[Dict[str, Any]]):
@@ -163,5 +309,94 @@ class ExtraClient:
             The response from the API.
         """
         endpoint = "/target"
-        response = await self._make_request("POST", endpoint, json=target_data)
+        # Settings for a single farm use that farm's rate limit
+        farm_ids = {target.get("farm_id") for target in target_data}
+        farm_id = farm_ids.pop() if len(farm_ids) == 1 else None
+        response = await self._make_request("POST", endpoint, json=target_data, farm_id=farm_id)
         return response
+
+    async def for_farms(self, farm_ids: Iterable[int], func: Callable[[int], Awaitable[Any]]) -> Dict[int, Any]:
+        """Run one coroutine per farm concurrently over the shared connection pool.
+
+        Rate limits are per farm, so adding farms does not slow down the
+        others. The shared limits are the connection pool ("concurrency"):
+        a request that cannot get a connection within its lane timeout fails
+        with asyncio.TimeoutError, so a sweep of N farms needs roughly
+        N * request time / concurrency to stay below the lane timeout.
+
+        A failure of one farm does not affect the others: its exception is
+        logged and returned in place of the result.
+
+        Args:
+            farm_ids: The IDs of the farms.
+            func: A coroutine function called with each farm ID.
+
+        Returns:
+            A dictionary mapping each farm ID to its result or exception.
+        """
+        farm_ids = list(farm_ids)
+        results = await asyncio.gather(*(func(farm_id) for farm_id in farm_ids), return_exceptions=True)
+        for farm_id, result in zip(farm_ids, results):
+            if isinstance(result, BaseException):
+                logging.error(f"Request for farm {farm_id} failed: {result!r}")
+        return dict(zip(farm_ids, results))
+
+    def camera_dataids(self, farm_id: int) -> List[int]:
+        """Return the camera data IDs of a farm.
+
+        dataids_for_camera in conf.json is either a list shared by every farm
+        or a dictionary keyed by farm ID.
+        """
+        if isinstance(self.dataids, dict):
+            return self.dataids.get(str(farm_id), self.dataids.get(farm_id, []))
+        return self.dataids
+
+    async def get_forecasts(self, farm_ids: Iterable[int]) -> Dict[int, Any]:
+        """Get the forecasts of several farms concurrently.
+
+        Returns:
+            A dictionary mapping each farm ID to its forecast data or exception.
+        """
+        return await self.for_farms(farm_ids, lambda farm_id: self.get_forecast(farm_id=farm_id))
+
+    async def get_images(self, farm_ids: Iterable[int]) -> Dict[int, Any]:
+        """Sweep the camera images of several farms concurrently.
+
+        Returns:
+            A dictionary mapping each farm ID to a dictionary of data ID to
+            get_image result or exception.
+        """
+        async def sweep(farm_id):
+            dataids = self.camera_dataids(farm_id)
+            results = await asyncio.gather(
+                *(self.get_image(farm_id=farm_id, data_id=data_id) for data_id in dataids),
+                return_exceptions=True
+            )
+            return dict(zip(dataids, results))
+
+        return await self.for_farms(farm_ids, sweep)
+
+    async def post_heartbeats(self, farm_ids: Iterable[int], content: str, category: str = "ai", created_time: str = None) -> Dict[int, Any]:
+        """Post the same heartbeat for several farms concurrently.
+
+        Returns:
+            A dictionary mapping each farm ID to its response or exception.
+        """
+        return await self.for_farms(
+            farm_ids,
+            lambda farm_id: self.post_heartbeat(content, farm_id=farm_id, category=category, created_time=created_time)
+        )
+
+    async def post_targets(self, target_data: List[Dict[str, Any]]) -> Dict[int, Any]:
+        """Post target settings grouped by farm, one request per farm, concurrently.
+
+        Args:
+            target_data: Target settings as for post_target. Each entry must have a farm_id.
+
+        Returns:
+            A dictionary mapping each farm ID to its response or exception.
+        """
+        groups: Dict[int, List[Dict[str, Any]]] = {}
+        for target in target_data:
+            groups.setdefault(target["farm_id"], []).append(target)
+        return await self.for_farms(groups, lambda farm_id: self.post_target(groups[farm_id]))
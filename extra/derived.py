@@ -0,0 +1,257 @@
+import math
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+# read_sensor.py 의 센서 이름과 동일하게 사용합니다.
+INSIDE_TEMP = "내부-온도"
+INSIDE_HUMIDITY = "내부-습도"
+INSIDE_CO2 = "내부-이산화탄소"
+CUMULATIVE_FLOW = "양액-누적유량"
+
+DEFAULT_SENSORS = [
+    "기상대-온도", "기상대-습도", "기상대-감우", "기상대-일사", "기상대-풍속", "기상대-풍향",
+    "내부-온도", "내부-습도", "내부-이산화탄소", "배지-EC", "배지-함수율", "배지-온도",
+    "양액-EC", "양액-pH", "양액-누적유량"
+]
+
+# Magnus coefficients (Tetens), shared by the vapor pressure and dew point formulas
+MAGNUS_E0 = 0.6108     # kPa
+MAGNUS_A = 17.27
+MAGNUS_B = 237.3       # °C
+
+
+def saturation_vapor_pressure(temp):
+    """Saturation vapor pressure in kPa (Tetens equation).
+
+    Args:
+        temp: Air temperature in degrees Celsius. Scalars and arrays are accepted.
+
+    Returns:
+        The saturation vapor pressure in kPa.
+    """
+    temp = np.asarray(temp, dtype=np.float64)
+    return MAGNUS_E0 * np.exp(MAGNUS_A * temp / (temp + MAGNUS_B))
+
+
+def vpd(temp, humidity):
+    """Vapor pressure deficit in kPa.
+
+    Args:
+        temp: Air temperature in degrees Celsius.
+        humidity: Relative humidity in percent.
+
+    Returns:
+        The vapor pressure deficit in kPa.
+    """
+    humidity = np.clip(np.asarray(humidity, dtype=np.float64), 0.0, 100.0)
+    return saturation_vapor_pressure(temp) * (1.0 - humidity / 100.0)
+
+
+def dew_point(temp, humidity):
+    """Dew point in degrees Celsius (Magnus formula).
+
+    Args:
+        temp: Air temperature in degrees Celsius.
+        humidity: Relative humidity in percent.
+
+    Returns:
+        The dew point temperature in degrees Celsius.
+    """
+    temp = np.asarray(temp, dtype=np.float64)
+    humidity = np.clip(np.asarray(humidity, dtype=np.float64), 0.01, 100.0)
+    gamma = np.log(humidity / 100.0) + MAGNUS_A * temp / (MAGNUS_B + temp)
+    return MAGNUS_B * gamma / (MAGNUS_A - gamma)
+
+
+class DerivedMetrics:
+    """Streaming derived quantities and rolling aggregates over polled sensors.
+
+    Every sensor occupies one column of fixed-size arrays, so a poll of all
+    sensors is folded in with a handful of vectorized operations. The EWMA,
+    window mean and rate of change are updated in O(1) per sample; window
+    min/max are kept in monotonic deques per sensor, which is amortized O(1)
+    per sample and O(1) per query.
+    Missing or failed readings are passed as None and leave the state untouched.
+    """
+
+    def __init__(self, names: List[str] = None, window: int = 60, alpha: float = 0.1):
+        """Create the engine.
+
+        Args:
+            names: The sensor names to track. Defaults to the sensors in read_sensor.py.
+            window: The number of samples kept for the windowed mean/min/max.
+            alpha: The EWMA smoothing factor (0 < alpha <= 1).
+
+        Raises:
+            ValueError: If window or alpha is out of range.
+        """
+        if window < 1:
+            error_msg = f"window must be positive: {window}"
+            raise ValueError(error_msg)
+        if not 0.0 < alpha <= 1.0:
+            error_msg = f"alpha must be in (0, 1]: {alpha}"
+            raise ValueError(error_msg)
+
+        self.names = list(names if names is not None else DEFAULT_SENSORS)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.window = window
+        self.alpha = alpha
+
+        size = len(self.names)
+        self.buffer = np.full((window, size), np.nan)
+        self.pos = 0
+        self.total = np.zeros(size)
+        self.valid = np.zeros(size, dtype=np.int64)
+        # (sample number, value) pairs; values increase in lows and decrease in highs
+        self.lows = [deque() for _ in range(size)]
+        self.highs = [deque() for _ in range(size)]
+        self.count = 0
+
+        self.value = np.full(size, np.nan)
+        self.ewma = np.full(size, np.nan)
+        self.rate = np.full(size, np.nan)
+        self.updated = np.full(size, np.nan)
+        self.timestamp = None
+
+    def _vector(self, values: Dict[str, Optional[float]]) -> np.ndarray:
+        vec = np.full(len(self.names), np.nan)
+        for name, val in values.items():
+            i = self.index.get(name)
+            if i is not None and val is not None:
+                vec[i] = val
+        return vec
+
+    def update(self, values: Dict[str, Optional[float]], timestamp: float = None):
+        """Fold one poll of sensor values into the running state.
+
+        Args:
+            values: A mapping from sensor name to observation. None marks a failed read.
+            timestamp: The poll time in epoch seconds. Defaults to the current time.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        x = self._vector(values)
+        ok = ~np.isnan(x)
+
+        # rate of change against the last valid sample of each sensor
+        dt = timestamp - self.updated
+        has_prev = ok & ~np.isnan(self.value) & (dt > 0)
+        self.rate = np.where(has_prev, (x - self.value) / np.where(has_prev, dt, 1.0), self.rate)
+
+        # EWMA, seeded by the first valid sample
+        seeded = ~np.isnan(self.ewma)
+        self.ewma = np.where(ok & seeded, self.alpha * x + (1.0 - self.alpha) * self.ewma, self.ewma)
+        self.ewma = np.where(ok & ~seeded, x, self.ewma)
+
+        # window: drop the outgoing row, add the incoming one
+        out = self.buffer[self.pos]
+        out_ok = ~np.isnan(out)
+        self.total -= np.where(out_ok, out, 0.0)
+        self.valid -= out_ok
+        self.total += np.where(ok, x, 0.0)
+        self.valid += ok
+        self.buffer[self.pos] = x
+        self.pos = (self.pos + 1) % self.window
+
+        # window min/max: expire samples that left the window, then push the new one
+        oldest = self.count - self.window
+        for i, val in enumerate(x.tolist()):
+            low, high = self.lows[i], self.highs[i]
+            while low and low[0][0] <= oldest:
+                low.popleft()
+            while high and high[0][0] <= oldest:
+                high.popleft()
+            if val == val:     # not NaN
+                while low and low[-1][1] >= val:
+                    low.pop()
+                low.append((self.count, val))
+                while high and high[-1][1] <= val:
+                    high.pop()
+                high.append((self.count, val))
+        self.count += 1
+
+        self.value = np.where(ok, x, self.value)
+        self.updated = np.where(ok, timestamp, self.updated)
+        self.timestamp = timestamp
+
+    def mean(self) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.valid > 0, self.total / self.valid, np.nan)
+
+    def minimum(self) -> np.ndarray:
+        return np.array([low[0][1] if low else np.nan for low in self.lows])
+
+    def maximum(self) -> np.ndarray:
+        return np.array([high[0][1] if high else np.nan for high in self.highs])
+
+    def _get(self, arr: np.ndarray, name: str) -> float:
+        i = self.index.get(name)
+        return math.nan if i is None else float(arr[i])
+
+    def derived(self) -> Dict[str, float]:
+        """Compute the derived quantities from the smoothed state.
+
+        Returns:
+            A dictionary with VPD (kPa), dew point (°C) and nutrient flow rate (per minute).
+        """
+        temp = self._get(self.ewma, INSIDE_TEMP)
+        humidity = self._get(self.ewma, INSIDE_HUMIDITY)
+        flow = self._get(self.rate, CUMULATIVE_FLOW)
+        # 누적유량이 초기화되면 음수 변화율이 나오므로 버립니다.
+        if flow < 0:
+            flow = math.nan
+        return {
+            "VPD": float(vpd(temp, humidity)),
+            "이슬점": float(dew_point(temp, humidity)),
+            "양액-유량": flow * 60.0
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the current state of every sensor and the derived quantities.
+
+        Returns:
+            A dictionary keyed by sensor name with value, ewma, mean, min, max and rate,
+            plus a "derived" entry holding the result of derived().
+        """
+        mean, low, high = self.mean(), self.minimum(), self.maximum()
+        result = {}
+        for name, i in self.index.items():
+            result[name] = {
+                "value": float(self.value[i]),
+                "ewma": float(self.ewma[i]),
+                "mean": float(mean[i]),
+                "min": float(low[i]),
+                "max": float(high[i]),
+                "rate": float(self.rate[i])
+            }
+        result["derived"] = self.derived()
+        return result
+
+    def as_target(self, farm_id: int, targettime: str, **setpoints: Optional[float]) -> Dict[str, Any]:
+        """Build a post_target entry from the caller's setpoints.
+
+        Observed values are never posted as setpoints: the entry holds the given
+        setpoints, and only the derived fields they leave out are filled in.
+        VPD is computed from the temperature and humidity setpoints when both
+        are given. The observed derived values are available from derived().
+
+        Args:
+            farm_id: The ID of the farm.
+            targettime: The target time in ISO format.
+            **setpoints: The target settings, e.g. temperature=25.5, humidity=65.0, CO2=800.0.
+
+        Returns:
+            A dictionary that can be passed in the list given to ExtraClient.post_target.
+        """
+        target = dict(setpoints)
+        temp, humidity = target.get("temperature"), target.get("humidity")
+        if target.get("VPD") is None and temp is not None and humidity is not None:
+            target["VPD"] = float(vpd(temp, humidity))
+        # NaN 은 JSON 으로 전송할 수 없으므로 None 으로 보냅니다.
+        target = {key: (None if isinstance(val, float) and math.isnan(val) else val) for key, val in target.items()}
+        target["farm_id"] = farm_id
+        target["targettime"] = targettime
+        return target
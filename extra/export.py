@@ -0,0 +1,245 @@
+import json
+import logging
+import math
+import os
+import time
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Tuple, Union
+
+import numpy as np
+
+from forecast import Forecast, ForecastLog
+
+# pyarrow is only needed to write the dataset, so it is imported when a file is opened.
+# Install it with `pip install pyarrow` to use the exporter.
+
+Record = Tuple[float, Dict[str, Optional[float]]]
+
+
+class HistoryLog:
+    """An append-only JSON Lines log of polled sensor and actuator values.
+
+    Each line is {"time": <epoch seconds>, "values": {<name>: <value>, ...}}.
+    Appending is cheap enough to do on every poll, and the exporter reads the
+    log back from a byte offset so only new lines are processed on each run.
+    """
+
+    def __init__(self, path: str = "history/history.jsonl"):
+        self.path = path
+
+    def append(self, values: Dict[str, Optional[float]], timestamp: float = None):
+        """Append one poll.
+
+        Args:
+            values: A mapping from column name to value. None marks a failed read.
+            timestamp: The poll time in epoch seconds. Defaults to the current time.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"time": timestamp, "values": values}, ensure_ascii=False) + "\n")
+
+    def read(self, offset: int = 0) -> Iterator[Tuple[int, Record]]:
+        """Stream the log from a byte offset.
+
+        Args:
+            offset: The byte offset to start from. The log is read from the start
+                    if it is shorter than the offset (e.g. after rotation).
+
+        Yields:
+            (offset after the line, (timestamp, values)) for every complete line.
+        """
+        if not os.path.exists(self.path):
+            return
+        if os.path.getsize(self.path) < offset:
+            offset = 0
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break   # a poll is still being written
+                offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning(f"Skipping malformed history line at byte {offset - len(line)}")
+                    continue
+                yield offset, (entry["time"], entry["values"])
+
+
+class DatasetExporter:
+    """Stream time-ordered history onto a fixed time grid and write Parquet parts.
+
+    Every grid row holds, for each column, the last value observed in that
+    step, plus the forecast interpolated at the row time. With a ForecastLog,
+    each row is joined against the forecast that was current at the row time,
+    so history older than the latest forecast keeps its forecast columns. Rows are buffered
+    in a fixed-size block and written as one row group per block, so memory
+    does not grow with the amount of history. Each run writes a new part file
+    and records a watermark, so the next run only processes newer data. The
+    step that is still open at the end of a run is left for the next run.
+    """
+
+    def __init__(self, outdir: str, columns: List[str], step: float = 60.0,
+                 chunk_rows: int = 4096, forecast: Union[Forecast, ForecastLog, None] = None):
+        """Create the exporter.
+
+        Args:
+            outdir: The dataset directory.
+            columns: The sensor and actuator columns to export, in order.
+            step: The grid step in seconds.
+            chunk_rows: The number of rows per row group.
+            forecast: The forecast to join, usually the ForecastLog written by
+                      ExtraClient.get_forecast. Its variables are prefixed with "forecast-".
+        """
+        self.outdir = outdir
+        self.columns = list(columns)
+        self.index = {name: i for i, name in enumerate(self.columns)}
+        self.step = step
+        self.chunk_rows = chunk_rows
+        self.forecast = forecast
+        self._variables: Optional[List[str]] = None
+        self.state_path = os.path.join(outdir, "_state.json")
+
+        self.times = np.empty(chunk_rows, dtype=np.float64)
+        self.values = np.empty((chunk_rows, len(self.columns)), dtype=np.float64)
+        self.rows = 0
+        self.writer = None
+        self.part_path = None
+        self.written = 0
+
+    def load_state(self) -> Dict[str, Any]:
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                return json.load(f)
+        return {"watermark": None, "offset": 0}
+
+    def save_state(self, state: Dict[str, Any]):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_path)
+
+    @property
+    def forecast_variables(self) -> List[str]:
+        # Fixed for the lifetime of the exporter so every row group has the same schema
+        if self._variables is None:
+            self._variables = [] if self.forecast is None else list(self.forecast.variables)
+        return self._variables
+
+    def _schema(self):
+        import pyarrow as pa
+
+        fields = [pa.field("time", pa.timestamp("s", tz="UTC"))]
+        fields += [pa.field(name, pa.float64()) for name in self.columns]
+        fields += [pa.field(f"forecast-{name}", pa.float64()) for name in self.forecast_variables]
+        return pa.schema(fields)
+
+    def _flush(self):
+        if self.rows == 0:
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        times = self.times[:self.rows]
+        arrays = [pa.array(times.astype("datetime64[s]"), type=pa.timestamp("s", tz="UTC"))]
+        arrays += [pa.array(self.values[:self.rows, i]) for i in range(len(self.columns))]
+        arrays += [pa.array(self.forecast.interpolate(name, times)) for name in self.forecast_variables]
+        schema = self._schema()
+
+        if self.writer is None:
+            os.makedirs(self.outdir, exist_ok=True)
+            self.part_path = os.path.join(self.outdir, f"part-{int(times[0])}.parquet")
+            self.writer = pq.ParquetWriter(self.part_path + ".tmp", schema)
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        self.written += self.rows
+        self.rows = 0
+
+    def _emit(self, grid_time: float, row: np.ndarray):
+        self.times[self.rows] = grid_time
+        self.values[self.rows] = row
+        self.rows += 1
+        if self.rows == self.chunk_rows:
+            self._flush()
+
+    def export(self, records: Iterable[Record], final: bool = False, state: Dict[str, Any] = None) -> int:
+        """Export time-ordered records newer than the stored watermark.
+
+        Args:
+            records: (timestamp, values) pairs in time order.
+            final: Also write the last, possibly incomplete, grid step.
+            state: The state to update and save. Loaded from the dataset if None.
+
+        Returns:
+            The number of rows written.
+        """
+        state = self.load_state() if state is None else state
+        watermark = state["watermark"]
+        current = None
+        row = np.full(len(self.columns), np.nan)
+
+        for timestamp, values in records:
+            if watermark is not None and timestamp < watermark:
+                continue
+            grid_time = math.floor(timestamp / self.step) * self.step
+            if current is None:
+                current = grid_time
+            elif grid_time > current:
+                self._emit(current, row)
+                row.fill(np.nan)
+                current = grid_time
+            elif grid_time < current:
+                logging.warning(f"Skipping out-of-order record at {timestamp}")
+                continue
+            for name, val in values.items():
+                i = self.index.get(name)
+                if i is not None and val is not None:
+                    row[i] = val
+
+        if current is not None:
+            if final:
+                self._emit(current, row)
+                state["watermark"] = current + self.step
+            else:
+                state["watermark"] = current
+        self._flush()
+
+        written = self.written
+        if self.writer is not None:
+            self.writer.close()
+            os.replace(self.part_path + ".tmp", self.part_path)
+            logging.info(f"Exported {written} rows to {self.part_path}")
+        self.writer = None
+        self.written = 0
+        os.makedirs(self.outdir, exist_ok=True)
+        self.save_state(state)
+        return written
+
+    def export_log(self, log: HistoryLog, final: bool = False) -> int:
+        """Export the lines appended to a history log since the last run.
+
+        Args:
+            log: The history log.
+            final: Also write the last, possibly incomplete, grid step.
+
+        Returns:
+            The number of rows written.
+        """
+        state = self.load_state()
+        start = state.get("offset", 0)
+
+        def records():
+            # The step still open at the end of the run is re-read next time,
+            # so remember where its first line starts.
+            resume = previous = start
+            current = None
+            for offset, record in log.read(start):
+                grid_time = math.floor(record[0] / self.step) * self.step
+                if grid_time != current:
+                    current = grid_time
+                    resume = previous
+                previous = offset
+                yield record
+            state["offset"] = previous if final else resume
+
+        return self.export(records(), final=final, state=state)
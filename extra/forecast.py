@@ -0,0 +1,283 @@
+import logging
+import math
+import os
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Union
+
+import numpy as np
+
+TIME_KEYS = ("time", "datetime", "forecast_time", "fcst_time", "timestamp", "targettime", "date")
+LIST_KEYS = ("forecast", "forecasts", "data", "items", "list", "result")
+
+TimeLike = Union[float, int, str, datetime]
+
+
+def to_epoch(value: TimeLike) -> float:
+    """Convert a timestamp to epoch seconds.
+
+    Args:
+        value: Epoch seconds, an ISO 8601 string or a datetime. Naive values are taken as local time.
+
+    Returns:
+        The timestamp in epoch seconds.
+
+    Raises:
+        ValueError: If the value cannot be interpreted as a time.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if isinstance(value, datetime):
+        return value.timestamp()
+    error_msg = f"Unsupported time value: {value!r}"
+    raise ValueError(error_msg)
+
+
+def _records(data: Any) -> List[Dict[str, Any]]:
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        for key in LIST_KEYS:
+            if isinstance(data.get(key), list):
+                return data[key]
+        # {"2025-01-15T15:00:00": {"temperature": ...}, ...}
+        if data and all(isinstance(val, dict) for val in data.values()):
+            return [dict(val, time=key) for key, val in data.items()]
+    error_msg = "Unrecognized forecast layout"
+    raise ValueError(error_msg)
+
+
+def _query(when) -> np.ndarray:
+    if isinstance(when, np.ndarray) and when.dtype.kind in "fi":
+        return when.astype(np.float64, copy=False)
+    if isinstance(when, (list, tuple, np.ndarray)):
+        return np.array([to_epoch(t) for t in when], dtype=np.float64)
+    return np.array([to_epoch(when)], dtype=np.float64)
+
+
+def _timekey(record: Dict[str, Any]) -> str:
+    for key in TIME_KEYS:
+        if key in record:
+            return key
+    error_msg = f"No time field in forecast record: {sorted(record)}"
+    raise ValueError(error_msg)
+
+
+class Forecast:
+    """A time-sorted, columnar view of a forecast.
+
+    The forecast is parsed once into a sorted array of epoch seconds and one
+    float64 array per variable, so lookups are binary searches and many
+    query times are interpolated in a single vectorized call.
+    """
+
+    def __init__(self, times: np.ndarray, columns: Dict[str, np.ndarray]):
+        order = np.argsort(times, kind="stable")
+        self.times = np.asarray(times, dtype=np.float64)[order]
+        self.columns = {name: np.asarray(col, dtype=np.float64)[order] for name, col in columns.items()}
+
+    @classmethod
+    def from_json(cls, data: Any) -> "Forecast":
+        """Parse the JSON returned by ExtraClient.get_forecast.
+
+        Args:
+            data: The decoded forecast. Either a list of records, a dictionary holding
+                  such a list, or a dictionary keyed by time.
+
+        Returns:
+            The parsed forecast. Non-numeric fields are ignored and missing values are NaN.
+
+        Raises:
+            ValueError: If the layout or a time field cannot be interpreted.
+        """
+        records = _records(data)
+        times = np.empty(len(records), dtype=np.float64)
+        columns: Dict[str, np.ndarray] = {}
+        for i, record in enumerate(records):
+            tkey = _timekey(record)
+            times[i] = to_epoch(record[tkey])
+            for name, val in record.items():
+                if name == tkey or isinstance(val, bool) or not isinstance(val, (int, float)):
+                    continue
+                if name not in columns:
+                    columns[name] = np.full(len(records), np.nan)
+                columns[name][i] = val
+        return cls(times, columns)
+
+    @classmethod
+    def load(cls, path: str) -> "Forecast":
+        """Load a forecast written by save().
+
+        Args:
+            path: The path of the .npz file.
+
+        Returns:
+            The loaded forecast.
+        """
+        with np.load(path, allow_pickle=False) as npz:
+            names = [str(name) for name in npz["names"]]
+            values = npz["values"]
+            return cls(npz["times"], {name: values[i] for i, name in enumerate(names)})
+
+    def save(self, path: str):
+        """Persist the forecast as an uncompressed .npz file.
+
+        Args:
+            path: The destination path.
+        """
+        names = list(self.columns)
+        values = np.vstack([self.columns[name] for name in names]) if names else np.empty((0, len(self.times)))
+        np.savez(path, times=self.times, names=np.array(names, dtype=str), values=values)
+
+    @property
+    def variables(self) -> List[str]:
+        return list(self.columns)
+
+    def __len__(self):
+        return len(self.times)
+
+    def index(self, when: TimeLike) -> int:
+        """Find the last forecast step at or before a time.
+
+        Args:
+            when: The query time.
+
+        Returns:
+            The index of that step, or -1 if the time precedes the forecast.
+        """
+        return int(np.searchsorted(self.times, to_epoch(when), side="right")) - 1
+
+    def interpolate(self, name: str, when) -> np.ndarray:
+        """Linearly interpolate one variable at arbitrary times.
+
+        Args:
+            name: The forecast variable.
+            when: A single time or a sequence of times (epoch seconds, ISO strings or datetimes).
+
+        Returns:
+            An array of interpolated values. Times outside the forecast range are NaN.
+
+        Raises:
+            KeyError: If the variable is not in the forecast.
+        """
+        col = self.columns[name]
+        query = _query(when)
+        valid = ~np.isnan(col)
+        if not valid.any():
+            return np.full(len(query), np.nan)
+        return np.interp(query, self.times[valid], col[valid], left=math.nan, right=math.nan)
+
+    def at(self, when) -> Dict[str, np.ndarray]:
+        """Interpolate every variable at the given times.
+
+        Args:
+            when: A single time or a sequence of times.
+
+        Returns:
+            A dictionary mapping each variable to its interpolated values.
+        """
+        query = _query(when)
+        return {name: self.interpolate(name, query) for name in self.columns}
+
+
+class ForecastLog:
+    """Every fetched forecast, kept by issue time.
+
+    Each forecast is saved as <root>/<issue time>.npz. Joining history against
+    the log uses, for every row, the forecast that was current at that time,
+    so rows older than the latest forecast still get the values predicted for
+    them. It offers the same variables/interpolate interface as Forecast.
+    """
+
+    def __init__(self, root: str = "forecasts/log", cache_size: int = 8):
+        """Create the log. Nothing is read from disk until it is first used.
+
+        Args:
+            root: The directory holding the forecasts.
+            cache_size: The number of loaded forecasts kept in memory.
+        """
+        self.root = root
+        self.cache_size = cache_size
+        self._cache: Dict[int, Forecast] = {}
+
+    def append(self, forecast: Forecast, issued: float = None) -> str:
+        """Save a forecast.
+
+        Args:
+            forecast: The forecast.
+            issued: The issue time in epoch seconds. Defaults to the current time.
+
+        Returns:
+            The path of the saved forecast.
+        """
+        issued = int(time.time() if issued is None else issued)
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, f"{issued}.npz")
+        tmp = os.path.join(self.root, f"{issued}.tmp.npz")
+        forecast.save(tmp)
+        os.replace(tmp, path)
+        self._cache.pop(issued, None)
+        return path
+
+    def issues(self) -> np.ndarray:
+        """Return the issue times of the saved forecasts in ascending order."""
+        if not os.path.isdir(self.root):
+            return np.empty(0, dtype=np.int64)
+        issued = []
+        for name in os.listdir(self.root):
+            stem, ext = os.path.splitext(name)
+            if ext == ".npz" and stem.isdigit():
+                issued.append(int(stem))
+        return np.array(sorted(issued), dtype=np.int64)
+
+    def load(self, issued: int) -> Forecast:
+        forecast = self._cache.get(issued)
+        if forecast is None:
+            if len(self._cache) >= self.cache_size:
+                self._cache.pop(next(iter(self._cache)))
+            forecast = self._cache[issued] = Forecast.load(os.path.join(self.root, f"{issued}.npz"))
+        return forecast
+
+    def current(self, when: TimeLike) -> Optional[Forecast]:
+        """Return the forecast that was current at a time, or None if none had been issued yet."""
+        issues = self.issues()
+        i = int(np.searchsorted(issues, to_epoch(when), side="right")) - 1
+        return None if i < 0 else self.load(int(issues[i]))
+
+    @property
+    def variables(self) -> List[str]:
+        """The variables of the latest forecast."""
+        issues = self.issues()
+        return [] if len(issues) == 0 else self.load(int(issues[-1])).variables
+
+    def interpolate(self, name: str, when) -> np.ndarray:
+        """Interpolate one variable, each time from the forecast current at that time.
+
+        Args:
+            name: The forecast variable.
+            when: A single time or a sequence of times.
+
+        Returns:
+            An array of interpolated values. NaN where no forecast had been issued
+            yet, or the current forecast does not cover the time or lacks the variable.
+        """
+        query = _query(when)
+        result = np.full(len(query), np.nan)
+        issues = self.issues()
+        if len(issues) == 0:
+            return result
+        which = np.searchsorted(issues, query, side="right") - 1
+        for i in np.unique(which):
+            if i < 0:
+                continue
+            rows = which == i
+            try:
+                forecast = self.load(int(issues[i]))
+            except (OSError, ValueError) as e:
+                logging.warning(f"Skipping unreadable forecast {issues[i]} in {self.root}: {e}")
+                continue
+            if name in forecast.columns:
+                result[rows] = forecast.interpolate(name, query[rows])
+        return result
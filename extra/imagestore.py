@@ -0,0 +1,195 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Dict, Any, Optional
+
+
+class ImageStore:
+    """A content-addressed image store with size-capped LRU eviction.
+
+    Image bytes are stored once under <root>/.objects/<hash[:2]>/<hash><ext>.
+    The names callers see (<root>/<farm_id>/<filename>) are hardlinks to those
+    objects, falling back to symlinks or copies where links are not supported.
+    An index records the hash, ETag and Last-Modified of the latest image of
+    every (farm_id, data_id), since data IDs may repeat across farms, so
+    unchanged frames can be skipped with a conditional request.
+    """
+
+    def __init__(self, root: str = "images", max_bytes: int = 512 * 1024 * 1024):
+        """Create the store. Nothing is read from disk until it is first used.
+
+        Args:
+            root: The directory holding the image names and the object store.
+            max_bytes: The total size of stored objects kept before the least
+                       recently used ones are evicted.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.objdir = os.path.join(root, ".objects")
+        self.index_path = os.path.join(root, ".index.json")
+        self._index: Optional[Dict[str, Any]] = None
+
+    @property
+    def index(self) -> Dict[str, Any]:
+        if self._index is None:
+            self._index = {"objects": {}, "names": {}}
+            if os.path.exists(self.index_path):
+                try:
+                    with open(self.index_path) as f:
+                        self._index = json.load(f)
+                except (OSError, json.JSONDecodeError) as e:
+                    logging.warning(f"Ignoring unreadable image index {self.index_path}: {e}")
+        return self._index
+
+    def _save(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self.index_path)
+
+    def _object_path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.objdir, digest[:2], digest + ext)
+
+    @staticmethod
+    def _key(farm_id: int, data_id: int) -> str:
+        return f"{farm_id}/{data_id}"
+
+    def lookup(self, farm_id: int, data_id: int) -> Optional[Dict[str, Any]]:
+        """Return the index entry of the latest image of a farm's data_id, if it is still stored."""
+        entry = self.index["names"].get(self._key(farm_id, data_id))
+        if entry is None or entry["hash"] not in self.index["objects"]:
+            return None
+        return entry
+
+    def conditional_headers(self, farm_id: int, data_id: int) -> Dict[str, str]:
+        """Build If-None-Match / If-Modified-Since headers for the latest image of a farm's data_id."""
+        entry = self.lookup(farm_id, data_id)
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def path(self, farm_id: int, data_id: int) -> Optional[str]:
+        entry = self.lookup(farm_id, data_id)
+        return None if entry is None else os.path.join(self.root, entry["filename"])
+
+    def read(self, farm_id: int, data_id: int) -> Optional[bytes]:
+        """Read the latest image of a farm's data_id and mark it as recently used."""
+        entry = self.lookup(farm_id, data_id)
+        return None if entry is None else self.read_object(entry["hash"])
+
+    def read_object(self, digest: str) -> Optional[bytes]:
+        """Read a stored object by hash and mark it as recently used.
+
+        Returns:
+            The image bytes, or None if the object has been evicted.
+        """
+        obj = self.index["objects"].get(digest)
+        if obj is None:
+            return None
+        try:
+            with open(self._object_path(digest, obj["ext"]), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        obj["atime"] = time.time()
+        self._save()
+        return data
+
+    def _link(self, src: str, dst: str):
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        if os.path.lexists(dst):
+            os.remove(dst)
+        try:
+            os.link(src, dst)
+        except OSError:
+            try:
+                os.symlink(os.path.relpath(src, os.path.dirname(dst)), dst)
+            except OSError:
+                shutil.copyfile(src, dst)
+
+    def put(self, farm_id: int, data_id: int, filename: str, data: bytes,
+            etag: str = None, last_modified: str = None) -> Dict[str, Any]:
+        """Store an image and point <root>/<farm_id>/<filename> at it.
+
+        Args:
+            farm_id: The ID of the farm.
+            data_id: The ID of the data.
+            filename: The name to expose under the farm's directory.
+            data: The image bytes.
+            etag: The ETag response header, if any.
+            last_modified: The Last-Modified response header, if any.
+
+        Returns:
+            A dictionary with image_path, hash and unchanged (True when the
+            farm's data_id already pointed at identical bytes).
+        """
+        key = self._key(farm_id, data_id)
+        filename = os.path.join(str(farm_id), os.path.basename(filename))
+        digest = hashlib.sha256(data).hexdigest()
+        ext = os.path.splitext(filename)[1]
+        objects = self.index["objects"]
+        names = self.index["names"]
+        previous = names.get(key)
+
+        obj = objects.get(digest)
+        if obj is None:
+            objpath = self._object_path(digest, ext)
+            os.makedirs(os.path.dirname(objpath), exist_ok=True)
+            tmp = objpath + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, objpath)
+            obj = objects[digest] = {"size": len(data), "ext": ext, "links": []}
+        obj["atime"] = time.time()
+
+        image_path = os.path.join(self.root, filename)
+        if filename not in obj["links"] or not os.path.exists(image_path):
+            self._link(self._object_path(digest, obj["ext"]), image_path)
+            for other in objects.values():
+                if filename in other["links"]:
+                    other["links"].remove(filename)
+            obj["links"].append(filename)
+
+        names[key] = {"hash": digest, "filename": filename, "etag": etag, "last_modified": last_modified}
+        self.evict(keep=digest)
+        self._save()
+        return {
+            "image_path": image_path,
+            "hash": digest,
+            "unchanged": previous is not None and previous["hash"] == digest
+        }
+
+    def evict(self, keep: str = None):
+        """Remove least recently used objects and their names until the store fits max_bytes.
+
+        Args:
+            keep: The hash of an object that must not be evicted, e.g. the one just stored.
+        """
+        objects = self.index["objects"]
+        total = sum(obj["size"] for obj in objects.values())
+        for digest in sorted(objects, key=lambda d: objects[d]["atime"]):
+            if total <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+            obj = objects.pop(digest)
+            total -= obj["size"]
+            for name in obj["links"]:
+                path = os.path.join(self.root, name)
+                if os.path.lexists(path):
+                    os.remove(path)
+            try:
+                os.remove(self._object_path(digest, obj["ext"]))
+            except FileNotFoundError:
+                pass
+            for key in [k for k, v in self.index["names"].items() if v["hash"] == digest]:
+                del self.index["names"][key]
+            logging.info(f"Evicted image object {digest} ({obj['size']} bytes)")
@@ -0,0 +1,111 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+
+# Pillow is only needed by the worker processes, so it is imported there.
+# Install it with `pip install pillow` to use the pipeline.
+
+HIST_BINS = 16
+
+
+def preprocess_image(image_path: str, outdir: str, size: Tuple[int, int], name: Optional[str] = None) -> Dict[str, Any]:
+    """Decode, resize and normalize one image. Runs in a worker process.
+
+    The thumbnail is written as a float32 .npy array of shape (height, width, 3)
+    scaled to [0, 1], and the features as a float32 .npy vector holding the
+    per-channel mean, standard deviation and a normalized histogram.
+
+    Args:
+        image_path: The path of the downloaded image.
+        outdir: The directory for the output arrays.
+        size: The maximum (width, height) of the thumbnail.
+        name: The output name relative to outdir, without extension. Defaults
+              to the image file name.
+
+    Returns:
+        A dictionary with the paths and shapes of the written arrays.
+    """
+    from PIL import Image
+
+    with Image.open(image_path) as img:
+        img = img.convert("RGB")
+        img.thumbnail(size)
+        pixels = np.asarray(img, dtype=np.float32) / 255.0
+
+    if name is None:
+        name = os.path.splitext(os.path.basename(image_path))[0]
+    array_path = os.path.join(outdir, f"{name}.npy")
+    os.makedirs(os.path.dirname(array_path) or ".", exist_ok=True)
+
+    out = np.lib.format.open_memmap(array_path + ".tmp", mode="w+", dtype=np.float32, shape=pixels.shape)
+    out[:] = pixels
+    out.flush()
+    del out
+    os.replace(array_path + ".tmp", array_path)
+
+    flat = pixels.reshape(-1, 3)
+    hist = np.concatenate([np.histogram(flat[:, c], bins=HIST_BINS, range=(0.0, 1.0))[0] for c in range(3)])
+    features = np.concatenate([flat.mean(axis=0), flat.std(axis=0), hist / max(len(flat), 1)]).astype(np.float32)
+    feature_path = os.path.join(outdir, f"{name}.features.npy")
+    np.save(feature_path, features)
+
+    return {
+        "array_path": array_path,
+        "shape": pixels.shape,
+        "feature_path": feature_path,
+        "features": len(features)
+    }
+
+
+def load_array(path: str) -> np.ndarray:
+    """Map an array written by the pipeline without copying it into memory."""
+    return np.load(path, mmap_mode="r")
+
+
+class ImagePipeline:
+    """Preprocess downloaded images on a process pool, off the event loop."""
+
+    def __init__(self, outdir: str = "features", size: Tuple[int, int] = (224, 224), workers: Optional[int] = None):
+        """Create the pipeline. Worker processes are started on first use.
+
+        Args:
+            outdir: The directory for the output arrays.
+            size: The maximum (width, height) of the thumbnails.
+            workers: The number of worker processes. Defaults to the CPU count.
+        """
+        self.outdir = outdir
+        self.size = tuple(size)
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def array_path(self, image_path: str, name: Optional[str] = None) -> str:
+        if name is None:
+            name = os.path.splitext(os.path.basename(image_path))[0]
+        return os.path.join(self.outdir, f"{name}.npy")
+
+    async def process(self, image_path: str, name: Optional[str] = None) -> Dict[str, Any]:
+        """Preprocess one image in a worker process.
+
+        Args:
+            image_path: The path of the downloaded image.
+            name: The output name relative to the output directory, without extension.
+
+        Returns:
+            The result of preprocess_image.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, preprocess_image, image_path, self.outdir, self.size, name)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,223 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, Tuple
+
+# Requests on the control lane are served before bulk transfers.
+CONTROL = "control"
+BULK = "bulk"
+
+DEFAULT_LANES = {
+    CONTROL: {"priority": 0, "timeout": 10.0},
+    BULK: {"priority": 1, "timeout": 60.0}
+}
+
+DEFAULT_ENDPOINTS = {
+    "/target": CONTROL,
+    "/heartbeat": CONTROL,
+    "/image": BULK,
+    "/forecast": BULK
+}
+
+# requests per second and burst size for each endpoint, per farm
+DEFAULT_RATES = {
+    "/target": {"rate": 5.0, "burst": 5},
+    "/heartbeat": {"rate": 1.0, "burst": 2},
+    "/image": {"rate": 4.0, "burst": 8},
+    "/forecast": {"rate": 1.0, "burst": 2}
+}
+
+
+class TokenBucket:
+    """A token bucket for asyncio tasks."""
+
+    def __init__(self, rate: float, burst: float):
+        """Create a bucket.
+
+        Args:
+            rate: The number of tokens added per second.
+            burst: The bucket capacity.
+
+        Raises:
+            ValueError: If rate or burst is not positive.
+        """
+        if rate <= 0 or burst <= 0:
+            error_msg = f"rate and burst must be positive: rate={rate}, burst={burst}"
+            raise ValueError(error_msg)
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        async with self.lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+    def refund(self):
+        """Return a token taken for a request that was never sent."""
+        self._refill()
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class PrioritySemaphore:
+    """A concurrency limit that wakes waiters in priority order.
+
+    Priority 0 may use every slot. Lower priorities (larger numbers) may only use
+    limit - reserved slots, so some capacity is always left for priority 0.
+    """
+
+    def __init__(self, limit: int, reserved: int = 0):
+        if limit < 1 or not 0 <= reserved < limit:
+            error_msg = f"Invalid concurrency limit: limit={limit}, reserved={reserved}"
+            raise ValueError(error_msg)
+        self.limit = limit
+        self.reserved = reserved
+        self.active = 0
+        self.waiters = []
+        self.seq = itertools.count()
+
+    def _capacity(self, priority: int) -> int:
+        return self.limit if priority == 0 else self.limit - self.reserved
+
+    def _pending(self, priority: int) -> bool:
+        return any(not fut.done() and prio <= priority for prio, _, fut in self.waiters)
+
+    async def acquire(self, priority: int):
+        """Wait for a slot.
+
+        Args:
+            priority: The priority of the caller. 0 is the highest.
+        """
+        if self.active < self._capacity(priority) and not self._pending(priority):
+            self.active += 1
+            return
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.seq), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # the slot was handed over just before cancellation
+            if fut.done() and not fut.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        """Release a slot and wake the highest priority waiter that fits."""
+        self.active -= 1
+        while self.waiters:
+            priority, _, fut = self.waiters[0]
+            if fut.done():
+                heapq.heappop(self.waiters)
+                continue
+            if self.active >= self._capacity(priority):
+                break
+            heapq.heappop(self.waiters)
+            self.active += 1
+            fut.set_result(None)
+
+
+class Lane:
+    def __init__(self, name: str, priority: int, timeout: float):
+        self.name = name
+        self.priority = priority
+        self.timeout = timeout
+
+
+class RequestScheduler:
+    """Per-endpoint, per-farm rate limits and a shared, prioritized concurrency limit.
+
+    Every farm gets its own token bucket for each endpoint, so fanning a
+    request out to N farms is not throttled to the rate of one farm. The
+    concurrency limit is shared by all farms and bounds the connection pool.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """Create the scheduler.
+
+        Args:
+            config: Optional settings, usually the "limits" entry of conf.json:
+                    {
+                        "concurrency": 4,
+                        "reserved": 1,
+                        "lanes": {"control": {"priority": 0, "timeout": 10.0}, ...},
+                        "endpoints": {"/target": "control", ...},
+                        "rates": {"/image": {"rate": 4.0, "burst": 8}, ...}
+                    }
+        """
+        config = config or {}
+        lanes = {**DEFAULT_LANES, **config.get("lanes", {})}
+        self.lanes = {name: Lane(name, lane["priority"], lane["timeout"]) for name, lane in lanes.items()}
+        self.endpoints = {**DEFAULT_ENDPOINTS, **config.get("endpoints", {})}
+        self.rates = {**DEFAULT_RATES, **config.get("rates", {})}
+        self.buckets: Dict[Tuple[str, Any], TokenBucket] = {}
+        concurrency = config.get("concurrency", 4)
+        if concurrency < 1:
+            error_msg = f"limits.concurrency must be at least 1: {concurrency}"
+            raise ValueError(error_msg)
+        # Keep one slot for the control lane unless there is only one slot
+        reserved = config.get("reserved", min(1, concurrency - 1))
+        if not 0 <= reserved < concurrency:
+            error_msg = f"limits.reserved must be at least 0 and less than limits.concurrency: reserved={reserved}, concurrency={concurrency}"
+            raise ValueError(error_msg)
+        self.semaphore = PrioritySemaphore(concurrency, reserved)
+
+    def lane(self, endpoint: str) -> Lane:
+        return self.lanes[self.endpoints.get(endpoint, BULK)]
+
+    def bucket(self, endpoint: str, farm_id: Any = None) -> Optional[TokenBucket]:
+        """Return the token bucket of an endpoint for one farm, created on first use."""
+        rate = self.rates.get(endpoint)
+        if rate is None:
+            return None
+        key = (endpoint, farm_id)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(rate["rate"], rate["burst"])
+        return bucket
+
+    @asynccontextmanager
+    async def slot(self, endpoint: str, farm_id: Any = None):
+        """Hold a request slot for an endpoint.
+
+        Waiting for a rate-limit token is queueing, not a failure, so it is not
+        timed. Only the wait for a concurrency slot is bounded by the lane
+        timeout; if it expires the token is returned to the bucket.
+
+        Args:
+            endpoint: The API endpoint about to be called.
+            farm_id: The farm the request is for. Requests without a farm share one bucket.
+
+        Yields:
+            The lane of the endpoint. Its timeout should be used for the request itself.
+
+        Raises:
+            asyncio.TimeoutError: If no concurrency slot was granted within the lane timeout.
+        """
+        lane = self.lane(endpoint)
+        bucket = self.bucket(endpoint, farm_id)
+        if bucket is not None:
+            await bucket.acquire()
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(lane.priority), lane.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            if bucket is not None:
+                bucket.refund()
+            raise
+        try:
+            yield lane
+        finally:
+            self.semaphore.release()
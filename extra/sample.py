@@ -90,6 +90,9 @@ async def main():
     except Exception as e:
         print(f"Error posting target: {e}")
 
+    # Close the shared connection pool
+    await client.aclose()
+
 if __name__ == "__main__":
     # To run this sample, you would typically execute `python sample.py` in your terminal.
     # This will run the asyncio event loop and execute the main coroutine.
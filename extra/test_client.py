@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+
+import httpx
+
+from client import ExtraClient
+
+
+def make_client(tmp_path, handler):
+    config = {"name": "test", "url": "http://extra", "apikey": "key",
+              "image_store": {"root": str(tmp_path / "images")}}
+    client = ExtraClient(config)
+    client._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def etag(data):
+    return '"' + hashlib.sha256(data).hexdigest() + '"'
+
+
+def test_get_image_conditional(tmp_path):
+    # The camera serves the same frame twice, then a new one.
+    frames = [b"frame-1", b"frame-1", b"frame-2"]
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        data = frames[len(requests) - 1]
+        if request.headers.get("if-none-match") == etag(data):
+            return httpx.Response(304, headers={"etag": etag(data)})
+        return httpx.Response(200, content=data, headers={"etag": etag(data), "content-type": "image/png"})
+
+    async def run():
+        async with make_client(tmp_path, handler) as client:
+            return [await client.get_image(farm_id=1, data_id=7) for _ in frames]
+
+    first, second, third = asyncio.run(run())
+
+    assert "if-none-match" not in requests[0].headers
+    assert requests[1].headers["if-none-match"] == etag(b"frame-1")
+    assert not first["unchanged"]
+
+    assert second["unchanged"]
+    assert second["hash"] == first["hash"]
+    assert second["image_data"] == b"frame-1"
+
+    assert not third["unchanged"]
+    assert third["hash"] != first["hash"]
+    assert third["image_data"] == b"frame-2"
+    with open(third["image_path"], "rb") as f:
+        assert f.read() == b"frame-2"
+
+
+def test_post_heartbeats_many_farms(tmp_path):
+    # Rate limits are per farm, so fanning out is not throttled to one farm's rate.
+    def handler(request):
+        return httpx.Response(200, json={"ok": True})
+
+    async def run():
+        async with make_client(tmp_path, handler) as client:
+            return await client.post_heartbeats(range(1, 31), "alive")
+
+    results = asyncio.run(run())
+
+    assert sorted(results) == list(range(1, 31))
+    assert all(isinstance(result, httpx.Response) for result in results.values())
+
+
+def test_get_image_not_modified_without_stored_frame(tmp_path):
+    # An unprompted 304 (or one for a frame evicted in flight) falls back to a full download.
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        if len(requests) == 1:
+            return httpx.Response(304)
+        return httpx.Response(200, content=b"frame-1", headers={"content-type": "image/png"})
+
+    async def run():
+        async with make_client(tmp_path, handler) as client:
+            return await client.get_image(farm_id=1, data_id=7)
+
+    result = asyncio.run(run())
+
+    assert len(requests) == 2
+    assert "if-none-match" not in requests[1].headers
+    assert result["image_data"] == b"frame-1"
+    assert not result["unchanged"]
+
+
+def test_get_image_farms_sharing_data_id(tmp_path):
+    # Farms may use the same data IDs; their frames must not be mixed up.
+    def handler(request):
+        data = f"farm-{request.url.params['farm_id']}".encode()
+        if request.headers.get("if-none-match") == etag(data):
+            return httpx.Response(304, headers={"etag": etag(data)})
+        return httpx.Response(200, content=data, headers={"etag": etag(data), "content-type": "image/png"})
+
+    async def run():
+        async with make_client(tmp_path, handler) as client:
+            first = await client.get_image(farm_id=1, data_id=1)
+            second = await client.get_image(farm_id=2, data_id=1)
+            return first, second
+
+    first, second = asyncio.run(run())
+
+    assert not second["unchanged"]
+    assert second["image_data"] == b"farm-2"
+    assert first["image_path"] != second["image_path"]
+    with open(first["image_path"], "rb") as f:
+        assert f.read() == b"farm-1"
+    with open(second["image_path"], "rb") as f:
+        assert f.read() == b"farm-2"